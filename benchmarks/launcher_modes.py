@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+launcher mode benchmark
+
+Times end to end `stratus <verb> <args>` invocations with the
+launcher in subprocess mode (launcher interpreter + child interpreter)
+against inprocess mode (entry point main called in the launcher).
+Each iteration starts a fresh interpreter for the launcher so that
+startup and import costs are included.
+
+Requires stratus to be installed so that the stratus-* console_scripts
+exist, eg:
+
+    python benchmarks/launcher_modes.py --verb release -n 20 -- gitflow new -h
+
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+LAUNCH = (
+    "import sys\n"
+    "from stratus.launcher import Delegate, DelegationRule\n"
+    "d = Delegate(mode=sys.argv[1], release='stratus-release', "
+    "build=DelegationRule(command='stratus-build'))\n"
+    "sys.exit(d(*sys.argv[2:]))\n"
+)
+
+
+def time_mode(mode, verb, args, iterations):
+    """
+    run the launcher in the given mode iterations times
+
+    :return: list of wall clock durations in seconds
+    """
+    command = [sys.executable, '-c', LAUNCH, mode, verb]
+    command.extend(args)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare stratus launcher modes')
+    parser.add_argument('--verb', default='release', help='stratus verb to launch')
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    parser.add_argument('--modes', nargs='+', default=['subprocess', 'inprocess'])
+    parser.add_argument('--json', default=None, help='write results to this file')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='args passed to the verb')
+    opts = parser.parse_args()
+    args = opts.args
+    if args and args[0] == '--':
+        args = args[1:]
+
+    results = {}
+    for mode in opts.modes:
+        # warm up disk caches and the stratus plugin/binary indexes
+        time_mode(mode, opts.verb, args, 1)
+        results[mode] = summarize(time_mode(mode, opts.verb, args, opts.iterations))
+
+    print(f"{'mode':<12}{'min':>10}{'median':>10}{'mean':>10}{'max':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<12}" + "".join(f"{r[k] * 1000:>8.1f}ms" for k in ('min', 'median', 'mean', 'max')))
+    if 'subprocess' in results and 'inprocess' in results:
+        saved = results['subprocess']['median'] - results['inprocess']['median']
+        print(f"inprocess saves {saved * 1000:.1f}ms per invocation (median)")
+
+    if opts.json:
+        with open(opts.json, 'w') as handle:
+            json.dump({'verb': opts.verb, 'args': args, 'iterations': opts.iterations,
+                       'results': results}, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
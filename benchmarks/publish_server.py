@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+local package index stand-in
+
+Minimal legacy-upload + simple index server for exercising the release
+publish engine without a real index:
+
+    python benchmarks/publish_server.py --dir /tmp/index --port 8080 --fail-rate 0.2 --latency 0.05
+    stratus-release gitflow publish -r http://localhost:8080/ --dist-dir dist
+
+POST / accepts multipart file uploads (409 if the file exists), and
+GET /simple/<project>/ lists the stored files with #sha256= fragments.
+--fail-rate makes that fraction of uploads fail with a 503 (and
+--fail-first the first N uploads) to exercise retries, and the number of connections opened is logged on exit to
+check that connections are being reused.
+
+"""
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+import email.parser
+import email.policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def normalize(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+class IndexHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(IndexHandler, self).setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super(IndexHandler, self).log_message(fmt, *args)
+
+    def _reply(self, status, body=b'', content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        match = re.match(r'^/simple/([^/]+)/?$', self.path)
+        if not match:
+            return self._reply(404, b'not found')
+        project = normalize(match.group(1))
+        project_dir = os.path.join(self.server.directory, project)
+        if not os.path.isdir(project_dir):
+            return self._reply(404, b'not found')
+        links = []
+        for filename in sorted(os.listdir(project_dir)):
+            with open(os.path.join(project_dir, filename), 'rb') as handle:
+                digest = hashlib.sha256(handle.read()).hexdigest()
+            links.append(f'<a href="/packages/{project}/{filename}#sha256={digest}">{filename}</a><br/>')
+        body = f"<html><body>{''.join(links)}</body></html>".encode('utf-8')
+        self._reply(200, body, 'text/html')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            fail = self.server.fail_first > 0 or random.random() < self.server.fail_rate
+            if fail:
+                self.server.fail_first = max(0, self.server.fail_first - 1)
+                self.server.failures += 1
+        if fail:
+            return self._reply(503, b'try again')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + data
+        )
+        fields = {}
+        content, filename = None, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'content':
+                filename = part.get_filename()
+                content = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_content()
+        if content is None or 'name' not in fields:
+            return self._reply(400, b'missing content or name')
+        if hashlib.sha256(content).hexdigest() != fields.get('sha256_digest'):
+            return self._reply(400, b'digest mismatch')
+        project_dir = os.path.join(self.server.directory, normalize(fields['name']))
+        os.makedirs(project_dir, exist_ok=True)
+        target = os.path.join(project_dir, os.path.basename(filename))
+        if os.path.exists(target):
+            return self._reply(409, b'file already exists')
+        with open(target, 'wb') as handle:
+            handle.write(content)
+        with self.server.lock:
+            self.server.uploads += 1
+        self._reply(200, b'ok')
+
+
+def serve(directory, port=0, fail_rate=0.0, latency=0.0, verbose=False, fail_first=0):
+    """
+    start the index server in a background thread
+
+    :return: server, its url is http://127.0.0.1:<server.server_port>/
+    """
+    os.makedirs(directory, exist_ok=True)
+    server = ThreadingHTTPServer(('127.0.0.1', port), IndexHandler)
+    server.daemon_threads = True
+    server.directory = directory
+    server.fail_rate = fail_rate
+    server.fail_first = fail_first
+    server.latency = latency
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.uploads = 0
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local upload/simple index server')
+    parser.add_argument('--dir', required=True, help='directory to store uploads in')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of uploads that get a 503')
+    parser.add_argument('--fail-first', type=int, default=0, help='number of initial uploads that get a 503')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to delay each upload')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    opts = parser.parse_args()
+    server = serve(opts.dir, opts.port, opts.fail_rate, opts.latency, opts.verbose, opts.fail_first)
+    print(f"serving {opts.dir} on http://127.0.0.1:{server.server_port}/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    print(
+        f"{server.uploads} uploads, {server.failures} injected failures, "
+        f"{server.connections} connections"
+    )
+    server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+PackageRepo benchmark suite
+
+Generates a synthetic git repository with a configurable number of
+commits, branches, tags and (local bare) remotes, then times the main
+PackageRepo operations against it. Results are written as json so runs
+from different commits can be compared:
+
+    python benchmarks/repository_ops.py --commits 20000 --tags 5000 --json before.json
+    # ... change things ...
+    python benchmarks/repository_ops.py --commits 20000 --tags 5000 --json after.json --compare before.json
+
+Only PackageRepo methods that exist in the original release are
+required, newer ones are timed when present, so a copy of this script
+can be pointed at an older checkout with --source to get a baseline:
+
+    git worktree add /tmp/stratus-old <commit>
+    python benchmarks/repository_ops.py --source /tmp/stratus-old --json before.json
+
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'bench',
+    'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'bench',
+    'GIT_COMMITTER_EMAIL': 'bench@example.com',
+}
+
+
+def git(*args, cwd=None, stdin=None):
+    env = dict(os.environ)
+    env.update(GIT_ENV)
+    process = subprocess.run(
+        ['git'] + list(args), cwd=cwd, input=stdin, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return process.stdout.decode('utf-8').strip()
+
+
+def fast_import_stream(commits, branches, tags):
+    """
+    build a git fast-import stream: a linear master history of commits,
+    tags spread evenly over it and branches forking off it
+    """
+    lines = []
+    when = 1500000000
+    for i in range(1, commits + 1):
+        data = f"change {i}\n"
+        msg = f"commit {i} --- with separator in subject"
+        lines.append('commit refs/heads/master')
+        lines.append(f"mark :{i}")
+        lines.append(f"committer bench <bench@example.com> {when + i} +0000")
+        lines.append(f"data {len(msg)}\n{msg}")
+        if i > 1:
+            lines.append(f"from :{i - 1}")
+        lines.append(f"M 644 inline file{i % 100}.txt")
+        lines.append(f"data {len(data)}\n{data}")
+    step = max(1, commits // max(1, tags))
+    for t in range(tags):
+        mark = min(commits, 1 + t * step)
+        lines.append(f"reset refs/tags/0.{t // 1000}.{t % 1000}")
+        lines.append(f"from :{mark}")
+    for b in range(branches):
+        mark = max(1, commits - b)
+        lines.append(f"reset refs/heads/feature/branch-{b}")
+        lines.append(f"from :{mark}")
+    lines.append('reset refs/heads/develop')
+    lines.append(f"from :{commits}")
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def make_repo(root, commits, branches, tags, remotes):
+    """create the synthetic repo and its bare remotes under root"""
+    repo = os.path.join(root, 'repo')
+    git('init', '-q', repo)
+    git('fast-import', '--quiet', cwd=repo, stdin=fast_import_stream(commits, branches, tags))
+    git('checkout', '-q', 'master', cwd=repo)
+    for r in range(remotes):
+        name = 'origin' if r == 0 else f"mirror{r}"
+        bare = os.path.join(root, f"{name}.git")
+        git('clone', '-q', '--bare', repo, bare)
+        git('remote', 'add', name, bare, cwd=repo)
+        git('fetch', '-q', name, cwd=repo)
+    return repo
+
+
+def timed(func, repeat, setup=None):
+    """run func repeat times, returning a list of durations"""
+    timings = []
+    for i in range(repeat):
+        arg = setup(i) if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_suite(repo_dir, opts):
+    from stratus.repository import PackageRepo
+    results = {}
+    tag_names = sorted(PackageRepo(repo_dir).tags.keys())
+    branches = [f"feature/branch-{b}" for b in range(opts.branches)] + ['missing/branch']
+
+    def record(name, timings):
+        results[name] = {
+            'runs': len(timings),
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'max': max(timings),
+        }
+        print(f"{name:<28}{results[name]['median'] * 1000:>10.2f}ms")
+
+    # cold: new PackageRepo each time, warm: reuse one instance
+    record('heads.cold', timed(lambda: len(PackageRepo(repo_dir).heads), opts.repeat))
+    record('tags.cold', timed(lambda: len(PackageRepo(repo_dir).tags), opts.repeat))
+    repo = PackageRepo(repo_dir)
+    record('heads.warm', timed(lambda: len(repo.heads), opts.repeat))
+    record('tags.warm', timed(lambda: len(repo.tags), opts.repeat))
+    record('tag_lookup.warm', timed(lambda: [t in repo.tags for t in tag_names[:100]], opts.repeat))
+
+    def branch_checks(fresh):
+        for b in branches:
+            fresh.remote_branch_exists('origin', b)
+    if opts.remotes:
+        # a new PackageRepo per run (created outside the timing) so
+        # nothing is cached from the previous run
+        record('remote_branch_exists', timed(
+            branch_checks, opts.repeat, setup=lambda i: PackageRepo(repo_dir)
+        ))
+
+    if len(tag_names) >= 2:
+        first, last = tag_names[0], tag_names[-1]
+        record('release_notes', timed(lambda: len(repo.release_notes(first, last)), opts.repeat))
+        iter_release_notes = getattr(repo, 'iter_release_notes', None)
+        if iter_release_notes is not None:
+            record('iter_release_notes', timed(
+                lambda: sum(1 for _ in iter_release_notes(first, last)), opts.repeat
+            ))
+
+    remote = 'origin' if opts.remotes else None
+    record('tag_release', timed(
+        lambda tag: repo.tag_release(tag, 'master', remote=remote),
+        opts.repeat, setup=lambda i: f"bench-tag-{i}"
+    ))
+
+    def merge_setup(i):
+        branch = f"bench/merge-{i}"
+        git('checkout', '-q', '-b', branch, 'master', cwd=repo_dir)
+        git('commit', '-q', '--allow-empty', '-m', f"merge source {i}", cwd=repo_dir)
+        git('checkout', '-q', 'master', cwd=repo_dir)
+        return branch
+    record('merge', timed(lambda br: repo.merge(br, 'develop', fastforward=False), opts.repeat, setup=merge_setup))
+
+    if opts.remotes:
+        record('initialize_branch', timed(
+            lambda br: repo.initialize_branch(br, 'origin'),
+            opts.repeat, setup=lambda i: f"bench/init-{i}"
+        ))
+    return results
+
+
+def compare(results, previous):
+    print(f"\n{'operation':<28}{'before':>10}{'after':>10}{'ratio':>8}")
+    for name, r in results.items():
+        before = previous.get('results', {}).get(name)
+        if before is None:
+            continue
+        ratio = r['median'] / before['median'] if before['median'] else float('nan')
+        print(f"{name:<28}{before['median'] * 1000:>8.1f}ms{r['median'] * 1000:>8.1f}ms{ratio:>8.2f}")
+
+
+def source_revision(source):
+    try:
+        return git('rev-parse', 'HEAD', cwd=source)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark PackageRepo operations')
+    parser.add_argument('--commits', type=int, default=2000)
+    parser.add_argument('--branches', type=int, default=50)
+    parser.add_argument('--tags', type=int, default=500)
+    parser.add_argument('--remotes', type=int, default=2, help='number of local bare remotes')
+    parser.add_argument('--repeat', '-r', type=int, default=5)
+    parser.add_argument('--json', default=None, help='write results to this file')
+    parser.add_argument('--compare', default=None, help='previous results file to compare with')
+    parser.add_argument('--keep', action='store_true', help='keep the generated repos')
+    parser.add_argument(
+        '--source', default=SOURCE_DIR,
+        help='stratus checkout to benchmark, defaults to the one containing this script'
+    )
+    opts = parser.parse_args()
+    opts.source = os.path.abspath(opts.source)
+    sys.path.insert(0, opts.source)
+    # PackageRepo commits/merges need an identity too
+    os.environ.update(GIT_ENV)
+
+    root = tempfile.mkdtemp(prefix='stratus-bench-')
+    try:
+        start = time.perf_counter()
+        repo_dir = make_repo(root, opts.commits, opts.branches, opts.tags, opts.remotes)
+        print(f"generated repo in {time.perf_counter() - start:.1f}s at {repo_dir}")
+        results = run_suite(repo_dir, opts)
+    finally:
+        if not opts.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        'meta': {
+            'revision': source_revision(opts.source),
+            'python': platform.python_version(),
+            'git': git('--version'),
+            'params': {k: getattr(opts, k) for k in ('commits', 'branches', 'tags', 'remotes', 'repeat')},
+        },
+        'results': results,
+    }
+    if opts.json:
+        with open(opts.json, 'w') as handle:
+            json.dump(output, handle, indent=2, sort_keys=True)
+    if opts.compare:
+        with open(opts.compare) as handle:
+            compare(results, json.load(handle))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
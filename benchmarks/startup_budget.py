@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+startup budget check
+
+Runs the help output of the stratus entry points in fresh interpreters
+and fails (exit code 1) if the median wall clock time of any of them is
+over budget. Meant to be run in CI to catch heavy imports creeping back
+into the startup path (tests/test_startup.py runs the same check in
+the test suite):
+
+    python benchmarks/startup_budget.py --budget 0.4
+
+Use `stratus --profile-startup ...` to see where the time goes.
+
+"""
+import os
+import sys
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stratus.startup import startup_budget, time_startup  # noqa: E402
+
+# command name, entry point, argv
+CHECKS = [
+    ('stratus --help', 'stratus.launcher:main', ['stratus', '--help']),
+    ('stratus-release -h', 'stratus.release.cli:main', ['stratus-release', '-h']),
+]
+
+
+def time_command(target, argv, iterations):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    return time_startup(target, argv, iterations, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='check stratus startup time budget')
+    parser.add_argument(
+        '--budget', type=float, default=None,
+        help='max median seconds per command, defaults to STRATUS_STARTUP_BUDGET or 0.5'
+    )
+    parser.add_argument('-n', '--iterations', type=int, default=5)
+    opts = parser.parse_args()
+    if opts.budget is None:
+        opts.budget = startup_budget()
+
+    failures = 0
+    for name, target, argv in CHECKS:
+        # warm up the plugin and binary indexes
+        time_command(target, argv, 1)
+        median = statistics.median(time_command(target, argv, opts.iterations))
+        over = median > opts.budget
+        failures += over
+        status = 'OVER BUDGET' if over else 'ok'
+        print(f"{name:<24}{median * 1000:>8.1f}ms  (budget {opts.budget * 1000:.0f}ms)  {status}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
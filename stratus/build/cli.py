@@ -4,8 +4,12 @@
 development environment builder cli
 
 """
+import os
+
 from arghandler import subcmd, ArgumentHandler
 
+from stratus.startup import check_profile_startup, startup_complete
+
 ENV_TYPES = {
     'venv': 'python -m venv',
     'virtualenv': 'virtualenv venv',
@@ -19,13 +23,90 @@ def _add_env_type(p):
     p.add_argument('type', nargs=1, help="environment type", choices=ENV_TYPES.keys())
 
 
+def _requirements(opts):
+    """requirements from -r files, or install_requires + tests_require from setup.cfg"""
+    if opts.requirements:
+        return [], opts.requirements
+    from stratus.configuration import Configuration
+    config = Configuration()
+    if os.path.exists('setup.cfg'):
+        config.load('setup.cfg')
+    return config.install_requires() + config.tests_require(), []
+
+
+def _print_cache_stats(cache):
+    stats = cache.stats()
+    print(
+        f"environment cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} environments, "
+        f"{stats['size'] / 1024 ** 2:.1f}MB"
+    )
+
+
 @subcmd('setup')
 def setup_command(parser, context, args):
     _add_env_type(parser)
     parser.add_argument('-p', '--python', default=None, help='python binary to use')
+    parser.add_argument('-d', '--dest', default='venv', help='environment directory to create')
+    parser.add_argument(
+        '-r', '--requirements', action='append', default=None,
+        help='requirements file, defaults to install_requires and tests_require from setup.cfg'
+    )
+    parser.add_argument(
+        '-w', '--wheelhouse', default=None,
+        help='install only from this wheelhouse dir, see the wheelhouse command'
+    )
+    parser.add_argument('--no-cache', action='store_true', help='always build a fresh environment')
+    parser.add_argument('--cache-stats', action='store_true', help='print environment cache hit rate')
     opts = parser.parse_args(args)
-    print(opts)
-    print(context)
+    env_type = opts.type[0]
+    if env_type != 'venv':
+        print(f"{env_type} environments are not supported yet")
+        return 1
+    from stratus.build import environment
+    if os.path.exists(opts.dest):
+        print(f"{opts.dest} already exists")
+        return 1
+    requirements, requirement_files = _requirements(opts)
+    install_args = []
+    if opts.wheelhouse:
+        from stratus.build.wheelhouse import install_args as wheelhouse_args
+        install_args = wheelhouse_args(opts.wheelhouse)
+    if opts.no_cache:
+        environment.create_venv(opts.dest, opts.python, requirements, requirement_files, install_args)
+        return 0
+    cache = environment.EnvironmentCache()
+    hit = cache.create(opts.dest, opts.python, requirements, requirement_files, install_args)
+    print(f"{'cloned cached' if hit else 'built and cached'} environment at {opts.dest}")
+    if opts.cache_stats:
+        _print_cache_stats(cache)
+    return 0
+
+
+@subcmd('wheelhouse', help='build wheels for the package requirements for offline installs')
+def wheelhouse_command(parser, context, args):
+    parser.add_argument('-w', '--wheelhouse', default='wheelhouse', help='directory to build wheels in')
+    parser.add_argument('-p', '--python', default=None, help='python binary to build wheels for')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parallel wheel builds')
+    parser.add_argument(
+        '-r', '--requirements', action='append', default=None,
+        help='requirements file, defaults to install_requires and tests_require from setup.cfg'
+    )
+    opts = parser.parse_args(args)
+    from stratus.build import wheelhouse
+    requirements, requirement_files = _requirements(opts)
+    for filename in requirement_files:
+        with open(filename) as handle:
+            lines = (line.split('#', 1)[0].strip() for line in handle)
+            requirements.extend(line for line in lines if line and not line.startswith('-'))
+    results = wheelhouse.build_wheelhouse(requirements, opts.wheelhouse, opts.python, opts.jobs)
+    failed = 0
+    for result in results:
+        print(f"{result.status:<8} {result.requirement:<40} {result.duration:>7.1f}s")
+        if result.status == wheelhouse.FAILED:
+            failed += 1
+            print(result.output)
+    return 1 if failed else 0
 
 
 @subcmd('build', help = 'build')
@@ -50,7 +131,10 @@ def run_command(parser, context, args):
 
 
 def main():
+    check_profile_startup('stratus.build.cli:main')
     handler = ArgumentHandler(use_subcommand_help=True)
+    # subcommands parse their own args as they run, so stop before that
+    startup_complete()
     handler.run()  # echo will be called and 'hello world' will be printed
 
     # parser = argparse.ArgumentParser(
@@ -0,0 +1,408 @@
+"""
+environment cache
+
+Cache of built venv environments for `stratus-build setup venv`, keyed by
+the interpreter (implementation, version, platform, base prefix) and a
+hash of the requirements installed into it. Requirements are resolved
+to exact versions with `pip install --dry-run --report` first, so an
+unpinned dependency that has a new release gets a new environment.
+
+A cache hit clones the cached environment into place with hardlinks
+(falling back to copies across filesystems) instead of reinstalling,
+only the scripts and config files that contain the environment path are
+copied and rewritten for the new location.
+
+The cache is bounded in size, least recently used environments are
+evicted first, and hit/miss counts are kept so the hit rate on CI can
+be checked with `stratus-build setup venv --cache-stats`. Updates to the
+cache index are made under a file lock so concurrent jobs sharing the
+cache dont lose each others entries or counts.
+
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import functools
+import contextlib
+import subprocess
+
+from stratus import trace
+from stratus.cache import cache_dir, read_json, write_json, file_lock
+
+# default max cache size in bytes, override with STRATUS_ENV_CACHE_SIZE (in MB)
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+BIN_DIR = 'Scripts' if os.name == 'nt' else 'bin'
+
+# files larger than this in the bin dir are binaries, never rewritten
+MAX_REWRITE_SIZE = 1024 * 1024
+
+# written into a built environment before it is moved into the cache,
+# records the path it was built at so clones can rewrite it
+ORIGIN_FILE = '.stratus-origin'
+
+INTERPRETER_SCRIPT = (
+    "import sys, platform, json\n"
+    "print(json.dumps([sys.implementation.name, platform.python_version(),"
+    " sys.platform, platform.machine(), sys.base_prefix]))"
+)
+
+
+def _run(command, cwd=None):
+    """run a command, raising RuntimeError with its output if it fails"""
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    trace.record_process(command, start, process.returncode, len(process.stdout))
+    if process.returncode:
+        raise RuntimeError(
+            f"{' '.join(command)} failed:\n{process.stdout.decode('utf-8', 'replace')}"
+        )
+    return process.stdout.decode('utf-8', 'replace')
+
+
+@functools.lru_cache(maxsize=None)
+def interpreter_id(python=None):
+    """
+    identify an interpreter by implementation, version, platform,
+    machine and base prefix, memoised per binary for the process
+
+    :param python: python binary, defaults to the current interpreter
+    :return: tuple of strings
+    """
+    return tuple(json.loads(_run([python or sys.executable, '-c', INTERPRETER_SCRIPT])))
+
+
+def _pin(item):
+    """name==version for an install item of a pip install report"""
+    metadata = item['metadata']
+    pin = f"{re.sub(r'[-_.]+', '-', metadata['name']).lower()}=={metadata['version']}"
+    info = item.get('download_info', {})
+    if 'vcs_info' in info:
+        pin = f"{pin} @ {info['url']}#{info['vcs_info'].get('commit_id', '')}"
+    elif 'dir_info' in info:
+        pin = f"{pin} @ {info['url']}"
+    return pin
+
+
+def resolve_requirements(python=None, requirements=(), requirement_files=(), install_args=()):
+    """
+    resolve requirements to the exact set pip would install into a
+    fresh environment, with pip install --dry-run --report (pip >= 22.2)
+
+    :param python: python binary to resolve for
+    :param install_args: extra pip install arguments, eg --no-index --find-links dir
+    :return: sorted list of name==version pins, None if pip couldnt resolve them
+    """
+    if not (requirements or requirement_files):
+        return []
+    command = [
+        python or sys.executable, '-m', 'pip', 'install', '--disable-pip-version-check',
+        '--dry-run', '--ignore-installed', '--quiet', '--report', '-'
+    ]
+    command.extend(install_args)
+    for filename in requirement_files:
+        command.extend(['-r', os.path.abspath(filename)])
+    command.extend(requirements)
+    start = time.perf_counter()
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    trace.record_process(command, start, process.returncode, len(process.stdout))
+    if process.returncode:
+        return None
+    try:
+        report = json.loads(process.stdout)
+    except ValueError:
+        return None
+    return sorted(_pin(item) for item in report.get('install', []))
+
+
+def requirements_hash(requirements=(), requirement_files=(), interpreter=None, resolved=None):
+    """
+    hash of the requirements for an environment. If the resolved pins
+    are given they are hashed, otherwise the specs (normalised and
+    sorted so ordering and whitespace in setup.cfg dont matter) and
+    the requirements file contents are.
+
+    :param requirements: iterable of requirement specs
+    :param requirement_files: iterable of requirements file paths, hashed by content
+    :param interpreter: interpreter_id() result to include in the key
+    :param resolved: resolve_requirements() result
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(interpreter or []).encode('utf-8'))
+    if resolved is not None:
+        for pin in resolved:
+            digest.update(b'pin\0' + pin.encode('utf-8') + b'\0')
+        return digest.hexdigest()
+    for spec in sorted({''.join(r.split()).lower() for r in requirements}):
+        digest.update(b'spec\0' + spec.encode('utf-8') + b'\0')
+    for filename in requirement_files:
+        with open(filename, 'rb') as handle:
+            digest.update(b'file\0' + handle.read() + b'\0')
+    return digest.hexdigest()
+
+
+def tree_size(path):
+    """bytes used by the regular files under path, hardlinks counted once"""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def _rewrite(src, dest, old, new):
+    """
+    copy src to dest replacing old with new if src is a small file
+    containing old, returns False if the file needs no rewrite
+    """
+    if os.path.getsize(src) > MAX_REWRITE_SIZE:
+        return False
+    with open(src, 'rb') as handle:
+        content = handle.read()
+    if old not in content:
+        return False
+    with open(dest, 'wb') as handle:
+        handle.write(content.replace(old, new))
+    shutil.copymode(src, dest)
+    return True
+
+
+def clone_tree(src, dest, origin=None):
+    """
+    clone an environment directory using hardlinks, the scripts and
+    pyvenv.cfg that refer to the path it was built at are copied and
+    rewritten to point at dest instead
+
+    :param src: cached environment dir
+    :param dest: new environment dir, must not exist
+    :param origin: path the environment was built at, if not src
+    """
+    src = os.path.abspath(src)
+    dest = os.path.abspath(dest)
+    origin = origin or src
+    old, new = origin.encode('utf-8'), dest.encode('utf-8')
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target_dir = os.path.normpath(os.path.join(dest, rel))
+        os.makedirs(target_dir, exist_ok=True)
+        rewrite = rel in (BIN_DIR, '.')
+        if rel == '.' and ORIGIN_FILE in files:
+            files.remove(ORIGIN_FILE)
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            target = os.path.join(target_dir, name)
+            if os.path.islink(path):
+                link = os.readlink(path)
+                if link.startswith(origin):
+                    link = dest + link[len(origin):]
+                os.symlink(link, target)
+            elif name in files:
+                if not (rewrite and _rewrite(path, target, old, new)):
+                    _link_or_copy(path, target)
+
+
+def create_venv(path, python=None, requirements=(), requirement_files=(), install_args=()):
+    """
+    create a venv at path and pip install the requirements into it
+
+    :param python: python binary to create the venv with
+    :param install_args: extra pip install arguments, eg --no-index --find-links dir
+    """
+    _run([python or sys.executable, '-m', 'venv', path])
+    if not (requirements or requirement_files):
+        return path
+    pip = [os.path.join(path, BIN_DIR, 'python'), '-m', 'pip', 'install', '--disable-pip-version-check']
+    pip.extend(install_args)
+    for filename in requirement_files:
+        pip.extend(['-r', os.path.abspath(filename)])
+    pip.extend(requirements)
+    _run(pip)
+    return path
+
+
+class EnvironmentCache(object):
+    """
+    Size bounded LRU cache of built environments
+
+    :param root: cache directory, defaults to the stratus cache envs dir
+    :param max_size: max total bytes of cached environments
+    """
+    def __init__(self, root=None, max_size=None):
+        self.root = root or cache_dir('envs')
+        os.makedirs(self.root, exist_ok=True)
+        if max_size is None:
+            size_mb = os.environ.get('STRATUS_ENV_CACHE_SIZE')
+            max_size = int(size_mb) * 1024 ** 2 if size_mb else DEFAULT_MAX_SIZE
+        self.max_size = max_size
+        self.index_file = os.path.join(self.root, 'index.json')
+        self.lock_file = os.path.join(self.root, 'index.lock')
+        self.index = self._read()
+
+    def _read(self):
+        index = read_json(self.index_file, default={})
+        index.setdefault('entries', {})
+        index.setdefault('hits', 0)
+        index.setdefault('misses', 0)
+        return index
+
+    @contextlib.contextmanager
+    def _update(self):
+        """
+        lock the index, re-read it and save it after the caller has
+        changed it, so concurrent processes dont overwrite each other
+        """
+        with file_lock(self.lock_file):
+            self.index = self._read()
+            yield self.index
+            write_json(self.index_file, self.index)
+
+    def key(self, python=None, requirements=(), requirement_files=(), install_args=()):
+        """
+        cache key for an interpreter and set of requirements, from the
+        resolved requirements, or from the specs if pip cant resolve
+        them (eg offline without a wheelhouse)
+        """
+        resolved = resolve_requirements(python, requirements, requirement_files, install_args)
+        return requirements_hash(requirements, requirement_files, interpreter_id(python), resolved)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """
+        path of the cached environment for key, None if it isnt cached.
+        Counts a hit or miss and marks the entry as recently used.
+        """
+        with self._update() as index:
+            entry = index['entries'].get(key)
+            if entry is None or not os.path.isdir(self.path(key)):
+                index['entries'].pop(key, None)
+                index['misses'] += 1
+                return None
+            entry['last_used'] = time.time()
+            index['hits'] += 1
+        return self.path(key)
+
+    def put(self, key, build, **info):
+        """
+        build an environment into the cache
+
+        :param key: cache key
+        :param build: callable taking the path to build the environment at
+        :param info: extra details to store with the entry
+        :return: path of the cached environment
+        """
+        final = self.path(key)
+        staging = f"{final}.tmp-{os.getpid()}"
+        built = False
+        try:
+            build(staging)
+            with open(os.path.join(staging, ORIGIN_FILE), 'w') as handle:
+                handle.write(staging)
+            os.rename(staging, final)
+            built = True
+        except OSError:
+            # another process cached the same environment first
+            if not os.path.isdir(final):
+                raise
+        finally:
+            if os.path.exists(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+        with self._update() as index:
+            if built or key not in index['entries']:
+                # the winner of a race may not have written its entry yet,
+                # the origin is taken from the environment it built
+                now = time.time()
+                index['entries'][key] = dict(
+                    info, origin=self._origin(key), size=tree_size(final), created=now, last_used=now
+                )
+            self._evict(index, keep=(key,))
+        return final
+
+    def _origin(self, key):
+        try:
+            with open(os.path.join(self.path(key), ORIGIN_FILE)) as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+    def _evict(self, index, keep=()):
+        entries = index['entries']
+        total = sum(e.get('size', 0) for e in entries.values())
+        evicted = []
+        for key in sorted(entries, key=lambda k: entries[k].get('last_used', 0)):
+            if total <= self.max_size:
+                break
+            if key in keep:
+                continue
+            total -= entries[key].get('size', 0)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            del entries[key]
+            evicted.append(key)
+        return evicted
+
+    def evict(self, keep=()):
+        """
+        remove least recently used environments until the cache is
+        within max_size
+
+        :param keep: keys that must not be evicted
+        :return: list of evicted keys
+        """
+        with self._update() as index:
+            return self._evict(index, keep)
+
+    def clone(self, key, dest):
+        """clone the cached environment for key to dest"""
+        entry = self.index['entries'].get(key, {})
+        clone_tree(self.path(key), dest, entry.get('origin') or self._origin(key))
+        return dest
+
+    def stats(self):
+        """dict of hits, misses, hit_rate, entries and size"""
+        self.index = self._read()
+        hits, misses = self.index['hits'], self.index['misses']
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(self.index['entries']),
+            'size': sum(e.get('size', 0) for e in self.index['entries'].values()),
+        }
+
+    def create(self, dest, python=None, requirements=(), requirement_files=(), install_args=()):
+        """
+        create an environment at dest, cloning a cached build if there
+        is one, otherwise building and caching it first
+
+        :return: True if it was a cache hit
+        """
+        key = self.key(python, requirements, requirement_files, install_args)
+        hit = self.get(key) is not None
+        if not hit:
+            self.put(
+                key,
+                lambda path: create_venv(path, python, requirements, requirement_files, install_args),
+                python=python or sys.executable,
+                requirements=list(requirements),
+            )
+        self.clone(key, dest)
+        return hit
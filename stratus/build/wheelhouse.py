@@ -0,0 +1,170 @@
+"""
+wheelhouse
+
+Build wheels for a package's requirements into a local directory so
+that environments can later be created offline with
+`pip install --no-index --find-links <wheelhouse>`.
+
+Each requirement is built by its own `pip wheel` in a process pool.
+Requirements that already have a matching wheel (by name, and version
+if the requirement pins or constrains one) are skipped. Each build
+writes to its own temporary dir and its wheels are renamed into the
+wheelhouse when it finishes, so the other builds (which use the
+wheelhouse with --find-links) never see a partially written wheel.
+
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import collections
+
+from stratus import trace
+
+WheelResult = collections.namedtuple('WheelResult', 'requirement status output duration')
+
+BUILT = 'built'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+REQUIREMENT_RE = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+CONSTRAINT_RE = re.compile(r'[<>=!~@]')
+
+
+def normalize_name(name):
+    """normalised project name as used in wheel filenames"""
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def requirement_name(requirement):
+    """project name of a requirement spec, eg 'requests' for 'requests[socks]>=2'"""
+    match = REQUIREMENT_RE.match(requirement)
+    return normalize_name(match.group(1)) if match else None
+
+
+def wheel_versions(wheelhouse):
+    """
+    map of normalised project name: set of versions with a wheel in the wheelhouse
+    """
+    versions = collections.defaultdict(set)
+    if not os.path.isdir(wheelhouse):
+        return versions
+    for filename in os.listdir(wheelhouse):
+        if not filename.endswith('.whl'):
+            continue
+        name, version = filename.split('-')[:2]
+        versions[normalize_name(name)].add(version)
+    return versions
+
+
+def _specifier(requirement):
+    """
+    version specifier of the requirement, None if it has no constraint,
+    False if it has one but packaging isnt available to evaluate it
+    """
+    try:
+        from packaging.requirements import Requirement, InvalidRequirement
+    except ImportError:
+        constrained = CONSTRAINT_RE.search(requirement.split(';', 1)[0])
+        return False if constrained else None
+    try:
+        spec = Requirement(requirement).specifier
+    except InvalidRequirement:
+        return None
+    return spec if str(spec) else None
+
+
+def has_wheel(requirement, versions):
+    """
+    check if a requirement is satisfied by a wheel already in the wheelhouse
+
+    :param requirement: requirement spec
+    :param versions: wheel_versions() of the wheelhouse
+    """
+    available = versions.get(requirement_name(requirement))
+    if not available:
+        return False
+    spec = _specifier(requirement)
+    if spec is None:
+        return True
+    if spec is False:
+        # cant tell if the available versions match, build it
+        return False
+    return any(spec.contains(v, prereleases=True) for v in available)
+
+
+def build_wheel(python, requirement, wheelhouse):
+    """
+    build the wheel for one requirement (and its dependencies) into a
+    temporary dir, then move the wheels into the wheelhouse, run in a
+    process pool worker
+
+    :return: WheelResult
+    """
+    start = time.perf_counter()
+    # inside the wheelhouse so the moves are renames on the same filesystem,
+    # pip only looks at the top level of --find-links dirs
+    wheel_dir = tempfile.mkdtemp(dir=wheelhouse, prefix='.build-')
+    try:
+        command = [
+            python, '-m', 'pip', 'wheel',
+            '--disable-pip-version-check',
+            '--wheel-dir', wheel_dir,
+            '--find-links', wheelhouse,
+            requirement
+        ]
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.stdout.decode('utf-8', 'replace')
+        status = FAILED if process.returncode else BUILT
+        if status == BUILT:
+            for filename in os.listdir(wheel_dir):
+                os.replace(os.path.join(wheel_dir, filename), os.path.join(wheelhouse, filename))
+    finally:
+        shutil.rmtree(wheel_dir, ignore_errors=True)
+    return WheelResult(requirement, status, output, time.perf_counter() - start)
+
+
+def build_wheelhouse(requirements, wheelhouse, python=None, jobs=None):
+    """
+    build wheels for requirements that arent in the wheelhouse yet
+
+    :param requirements: iterable of requirement specs
+    :param wheelhouse: directory to write wheels to
+    :param python: python binary to run pip with, wheels are built for it
+    :param jobs: max parallel builds, defaults to the cpu count
+    :return: list of WheelResult in requirement order
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    python = python or sys.executable
+    os.makedirs(wheelhouse, exist_ok=True)
+    wheelhouse = os.path.abspath(wheelhouse)
+    versions = wheel_versions(wheelhouse)
+    results = {}
+    pending = []
+    for requirement in requirements:
+        if has_wheel(requirement, versions):
+            results[requirement] = WheelResult(requirement, SKIPPED, '', 0.0)
+        else:
+            pending.append(requirement)
+    if pending:
+        jobs = min(jobs or os.cpu_count() or 1, len(pending))
+        with trace.span('build wheels', cat='build', count=len(pending)):
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(build_wheel, python, r, wheelhouse) for r in pending]
+                for future in futures:
+                    result = future.result()
+                    trace.record_process(
+                        ['pip', 'wheel', result.requirement],
+                        time.perf_counter() - result.duration,
+                        int(result.status == FAILED), len(result.output)
+                    )
+                    results[result.requirement] = result
+    return [results[r] for r in requirements]
+
+
+def install_args(wheelhouse):
+    """pip install arguments to install only from the wheelhouse"""
+    return ['--no-index', '--find-links', os.path.abspath(wheelhouse)]
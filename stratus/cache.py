@@ -0,0 +1,105 @@
+"""
+local cache helpers
+
+Shared location and write helpers for the small on-disk caches
+stratus keeps between command invocations.
+
+"""
+import os
+import json
+import contextlib
+
+
+def cache_dir(*parts):
+    """
+    get (and create) the stratus cache directory, optionally a
+    subdirectory of it.
+    Allows override by STRATUS_CACHE_DIR env var, otherwise
+    uses XDG_CACHE_HOME or ~/.cache.
+    If the directory cant be created (eg a read only home dir) the
+    path is still returned, reads of the cache files then miss and
+    writes fail quietly so the cache is effectively disabled
+
+    :param parts: optional subdirectory path elements
+    :return: path to directory
+    """
+    base = os.environ.get('STRATUS_CACHE_DIR')
+    if base is None:
+        xdg = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        base = os.path.join(xdg, 'stratus')
+    path = os.path.join(base, *parts)
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        pass
+    return path
+
+
+def atomic_write(filename, content, mode='w'):
+    """
+    write content to filename via a temp file in the same
+    directory and a rename, so readers never see a partial file
+
+    :param filename: destination path
+    :param content: str or bytes to write
+    :param mode: 'w' for text, 'wb' for bytes
+    """
+    import tempfile
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-', suffix=os.path.basename(filename))
+    try:
+        with os.fdopen(fd, mode) as handle:
+            handle.write(content)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, filename)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(filename):
+    """
+    exclusive advisory lock on filename (created if missing), for
+    read-modify-write updates of cache files shared between processes.
+    Does nothing where fcntl isnt available
+
+    :param filename: lock file path
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(filename, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def read_json(filename, default=None):
+    """
+    read a json cache file, returning default if it is missing
+    or unreadable
+    """
+    try:
+        with open(filename, 'r') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(filename, data):
+    """
+    atomically write data to a json cache file, cache write
+    failures are not fatal
+    """
+    try:
+        atomic_write(filename, json.dumps(data, sort_keys=True))
+    except OSError:
+        return False
+    return True
@@ -1,7 +1,221 @@
 
+import os
+import re
+import marshal
+import hashlib
 import configparser
 
 from stratus.versions import PackageVersion
+from stratus.cache import cache_dir, atomic_write
+
+
+def parse_sections(filename):
+    """
+    parse a config file into a parser and a
+    dict of section: {option: value}
+    """
+    parser = configparser.RawConfigParser()
+    parser.read(filename)
+    sections = {}
+    for section in parser.sections():
+        sections[section] = {
+            option: parser.get(section, option)
+            for option in parser.options(section)
+        }
+    return parser, sections
+
+
+SECTION_RE = re.compile(r'^\[(?P<name>[^\]]+)\]')
+OPTION_RE = re.compile(r'^(?P<key>[^=:\s][^=:]*?)\s*[=:]\s?(?P<value>.*)$')
+COMMENT_PREFIXES = ('#', ';')
+
+
+def _is_comment(line):
+    return line.strip().startswith(COMMENT_PREFIXES)
+
+
+def _section_spans(lines):
+    """
+    find sections in config file lines
+
+    :return: dict of section name: (header line index, end index)
+    """
+    spans = {}
+    current = None
+    for i, line in enumerate(lines):
+        m = SECTION_RE.match(line)
+        if m:
+            if current is not None:
+                spans[current[0]] = (current[1], i)
+            current = (m.group('name'), i)
+    if current is not None:
+        spans[current[0]] = (current[1], len(lines))
+    return spans
+
+
+def _option_spans(lines, start, end):
+    """
+    find options within the lines of a section, including any indented
+    continuation lines of multi line values
+
+    :return: dict of option name: (key as written, start, end, value)
+    """
+    options = {}
+    i = start
+    while i < end:
+        line = lines[i]
+        m = OPTION_RE.match(line.rstrip('\r\n'))
+        if not m or line[0].isspace() or _is_comment(line):
+            i += 1
+            continue
+        key = m.group('key').strip()
+        values = [m.group('value').strip()]
+        j = i + 1
+        last = i
+        while j < end and (not lines[j].strip() or lines[j][0].isspace()):
+            if lines[j].strip():
+                last = j
+                if not _is_comment(lines[j]):
+                    values.append(lines[j].strip())
+            j += 1
+        options[key.lower()] = (key, i, last + 1, '\n'.join(values).rstrip())
+        i = last + 1
+    return options
+
+
+def render_option(key, value):
+    """render an option as config file lines, indenting continuation lines"""
+    first, *rest = str(value).split('\n')
+    result = [f"{key} = {first}".rstrip() + '\n']
+    result.extend(f"    {line}\n" if line else '\n' for line in rest)
+    return result
+
+
+def rewrite_sections(lines, changes):
+    """
+    apply section changes to config file lines, touching only the
+    lines of options that were added, removed or changed so that
+    comments and formatting elsewhere are preserved
+
+    :param lines: list of lines of the existing file
+    :param changes: dict of section name: {option: value}, or None to remove the section
+    :return: new list of lines
+    """
+    spans = _section_spans(lines)
+    edits = []
+    appended = []
+    for section, options in changes.items():
+        if section not in spans:
+            if options is not None:
+                appended.append(f"[{section}]\n")
+                for key, value in options.items():
+                    appended.extend(render_option(key, value))
+            continue
+        start, end = spans[section]
+        if options is None:
+            edits.append((start, end, []))
+            continue
+        existing = _option_spans(lines, start + 1, end)
+        insert_at = start + 1
+        for name, (key, o_start, o_end, value) in existing.items():
+            insert_at = max(insert_at, o_end)
+            if name not in options:
+                edits.append((o_start, o_end, []))
+            elif str(options[name]) != value:
+                edits.append((o_start, o_end, render_option(key, options[name])))
+        added = []
+        for key, value in options.items():
+            if key.lower() not in existing:
+                added.extend(render_option(key, value))
+        if added:
+            edits.append((insert_at, insert_at, added))
+
+    result = list(lines)
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        result[start:end] = replacement
+    if appended:
+        if result and not result[-1].endswith('\n'):
+            result[-1] += '\n'
+        if result and result[-1].strip():
+            result.append('\n')
+        result.extend(appended)
+    return result
+
+
+def write_sections(filename, changes, source=None):
+    """
+    write section changes to filename in place, via a temp file and rename.
+    Nothing is written if the changes dont alter the file
+
+    :param filename: config file to write
+    :param changes: dict of section name: {option: value} or None to remove
+    :param source: file to take the existing content from, defaults to filename
+    :return: True if the file was written
+    """
+    source = source or filename
+    lines = []
+    if os.path.exists(source):
+        with open(source, 'r') as handle:
+            lines = handle.readlines()
+    new_lines = rewrite_sections(lines, changes)
+    if new_lines == lines and source == filename:
+        return False
+    atomic_write(filename, ''.join(new_lines))
+    return True
+
+
+class ConfigCache(object):
+    """
+    On disk cache of parsed config files keyed by path, mtime and size.
+    Each section is marshalled separately so readers only unmarshal the
+    sections they actually use.
+
+    :param dirname: cache directory, defaults to the stratus cache
+    """
+    def __init__(self, dirname=None):
+        self.dirname = dirname or cache_dir('config')
+
+    def _key(self, filename):
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size, marshal.version)
+
+    def _entry_file(self, path):
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.dirname, f"{digest}.marshal")
+
+    def get(self, filename):
+        """
+        get the cached sections for filename if the cache entry matches
+        the files current mtime and size
+
+        :return: dict of section name: marshalled options, or None
+        """
+        key = self._key(filename)
+        try:
+            with open(self._entry_file(key[0]), 'rb') as handle:
+                entry = marshal.load(handle)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if entry.get('key') != key:
+            return None
+        return entry['sections']
+
+    def put(self, filename, sections):
+        """
+        cache parsed sections for filename
+
+        :param sections: dict of section: {option: value}
+        :return: dict of section name: marshalled options
+        """
+        key = self._key(filename)
+        blobs = {name: marshal.dumps(options) for name, options in sections.items()}
+        try:
+            atomic_write(self._entry_file(key[0]), marshal.dumps({'key': key, 'sections': blobs}), mode='wb')
+        except OSError:
+            # caching is best effort
+            pass
+        return blobs
 
 
 
@@ -36,12 +250,21 @@ class PackageConfig(object):
 
     def save(self, filename):
         """
-        save this config file
+        save this config file, only rewriting lines that changed
         :param filename:
-        :return:
+        :return: True if the file was written
         """
-        with open(filename, 'w') as handle:
-            self.parser.write(handle)
+        sections = {
+            section: dict(self.parser.items(section))
+            for section in self.parser.sections()
+        }
+        if os.path.exists(filename):
+            _, current = parse_sections(filename)
+            changes = {k: v for k, v in sections.items() if current.get(k) != v}
+            changes.update({k: None for k in current if k not in sections})
+        else:
+            changes = sections
+        return write_sections(filename, changes)
 
     def has_section(self, section):
         return section in self
@@ -56,35 +279,168 @@ class Configuration(dict):
     """
     Wrapper and API around the setup.cfg file used to manipulate package settings
 
+    Parsed sections are cached on disk by ConfigCache, a load that hits the cache
+    only unmarshals a section when it is first accessed and doesnt build the
+    RawConfigParser until something needs it (eg save or add_section)
     """
+    _PACKAGE_SECTION = 'metadata'
+    _GITFLOW_SECTION = 'stratus.branches'
+    _OPTIONS_SECTION = 'options'
 
     def __init__(self):
-        super(Configuration, self).__init__(self)
-        self.parser = None
-
-    def load(self, filename):
+        super(Configuration, self).__init__()
+        self._parser = None
+        self._filename = None
+        self._lazy = {}
+        self._original = {}
+
+    @property
+    def parser(self):
+        """RawConfigParser for the loaded file, parsed on first use"""
+        if self._parser is None:
+            self._parser = configparser.RawConfigParser()
+            if self._filename is not None:
+                self._parser.read(self._filename)
+        return self._parser
+
+    @parser.setter
+    def parser(self, value):
+        self._parser = value
+
+    def load(self, filename, cache=True):
         """
         read config from disk
 
+        :param filename: path to config file
+        :param cache: use the parsed config cache
         """
-        self.parser = configparser.RawConfigParser()
-        self.parser.read(filename)
-        for section in self.parser.sections():
-            self.setdefault(section, {})
-            for option in self.parser.options(section):
-                self[section].setdefault(
-                    option,
-                    self.parser.get(section, option)
-                )
+        self._filename = filename
+        config_cache = ConfigCache() if cache else None
+        blobs = config_cache.get(filename) if config_cache else None
+        if blobs is None:
+            self._parser, sections = parse_sections(filename)
+            if config_cache:
+                blobs = config_cache.put(filename, sections)
+            else:
+                blobs = {k: marshal.dumps(v) for k, v in sections.items()}
+            self._original = dict(blobs)
+            for section, options in sections.items():
+                self._lazy.pop(section, None)
+                self.setdefault(section, {})
+                for option, value in options.items():
+                    self[section].setdefault(option, value)
+            return
+        self._original = dict(blobs)
+        for section, blob in blobs.items():
+            if not dict.__contains__(self, section):
+                self._lazy[section] = blob
+
+    def _materialize(self, section):
+        blob = self._lazy.pop(section, None)
+        if blob is not None:
+            dict.__setitem__(self, section, marshal.loads(blob))
+
+    def _materialize_all(self):
+        for section in list(self._lazy):
+            self._materialize(section)
+
+    def __getitem__(self, section):
+        self._materialize(section)
+        return dict.__getitem__(self, section)
+
+    def __contains__(self, section):
+        return section in self._lazy or dict.__contains__(self, section)
+
+    def __setitem__(self, section, value):
+        self._lazy.pop(section, None)
+        dict.__setitem__(self, section, value)
+
+    def __delitem__(self, section):
+        if self._lazy.pop(section, None) is None:
+            dict.__delitem__(self, section)
+
+    def __iter__(self):
+        self._materialize_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._lazy)
+
+    def __repr__(self):
+        self._materialize_all()
+        return dict.__repr__(self)
+
+    def get(self, section, default=None):
+        self._materialize(section)
+        return dict.get(self, section, default)
+
+    def setdefault(self, section, default=None):
+        self._materialize(section)
+        return dict.setdefault(self, section, default)
+
+    def pop(self, section, *default):
+        self._materialize(section)
+        return dict.pop(self, section, *default)
+
+    def keys(self):
+        self._materialize_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._materialize_all()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize_all()
+        return dict.items(self)
+
+    def dirty_sections(self):
+        """
+        sections that differ from what was loaded, sections that were
+        never accessed are clean by definition
 
-    def save(self, filename):
+        :return: dict of section: options, or None for removed sections
         """
-        save this config file
-        :param filename:
-        :return:
+        changes = {}
+        for section, options in dict.items(self):
+            blob = self._original.get(section)
+            # marshal output depends on refcounts, compare the decoded values
+            if blob is None or marshal.loads(blob) != options:
+                changes[section] = options
+        for section in self._original:
+            if section not in self:
+                changes[section] = None
+        return changes
+
+    def save(self, filename=None):
+        """
+        save this config file. Only the lines of options that changed are
+        rewritten, and the file is replaced atomically. If nothing has
+        changed the file is not touched.
+
+        :param filename: defaults to the file that was loaded
+        :return: True if the file was written
+        """
+        filename = filename or self._filename
+        changes = self.dirty_sections()
+        source = self._filename if self._filename and os.path.exists(self._filename) else None
+        if not changes and source and os.path.abspath(source) == os.path.abspath(filename):
+            return False
+        written = write_sections(filename, changes, source=source)
+        for section, options in changes.items():
+            if options is None:
+                self._original.pop(section, None)
+            else:
+                self._original[section] = marshal.dumps(options)
+        self._filename = filename
+        self._parser = None
+        return written
+
+    def set_param(self, section, param, value):
         """
-        with open(filename, 'w') as handle:
-            self.parser.write(handle)
+        set an option, adding the section if needed
+        """
+        self.setdefault(section, {})[param] = value
 
     def has_section(self, section):
         return section in self
@@ -92,7 +448,8 @@ class Configuration(dict):
     def add_section(self, section):
         if not self.has_section(section):
             self[section] = {}
-            self.parser.add_section(section)
+            if self._parser is not None:
+                self._parser.add_section(section)
 
     def get_param(self, section, param, default=None):
         """
@@ -117,6 +474,18 @@ class Configuration(dict):
     def author_email(self):
         return self.get(self._PACKAGE_SECTION, {}).get('author_email')
 
+    def _option_list(self, param):
+        """multi line option from the options section as a list, comments removed"""
+        value = self.get(self._OPTIONS_SECTION, {}).get(param) or ''
+        lines = (line.split('#', 1)[0].strip() for line in value.splitlines())
+        return [line for line in lines if line]
+
+    def install_requires(self):
+        return self._option_list('install_requires')
+
+    def tests_require(self):
+        return self._option_list('tests_require')
+
     def gitflow_branch_name(self):
         return self.get(self._GITFLOW_SECTION, {}).get('develop_branch', 'develop')
 
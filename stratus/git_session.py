@@ -0,0 +1,198 @@
+"""
+git session
+
+Long lived git plumbing processes for a repo, so that object and ref
+lookups go down an open pipe instead of forking a new git per call:
+
+ - git cat-file --batch-check for rev -> sha/type/size lookups
+ - git cat-file --batch for reading object contents
+ - git update-ref --stdin for applying a batch of ref writes in one
+   transaction
+
+"""
+import os
+import atexit
+import time
+import threading
+import subprocess
+import collections
+
+from stratus import trace
+
+ObjectInfo = collections.namedtuple('ObjectInfo', 'sha type size')
+CommitInfo = collections.namedtuple('CommitInfo', 'sha tree parents author committer message')
+
+ZERO_SHA = '0' * 40
+
+
+class GitSession(object):
+    """
+    Pool of persistent git cat-file processes for a repo directory.
+    Processes are started on first use and stopped by close(), at exit
+    or when used as a context manager.
+
+    :param repo_dir: path to the repo working dir (or git dir)
+    :param git: git executable to run
+    """
+    def __init__(self, repo_dir, git='git'):
+        self.dir = repo_dir
+        self.git = git
+        self._procs = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _process(self, mode):
+        proc = self._procs.get(mode)
+        if proc is None or proc.poll() is not None:
+            proc = subprocess.Popen(
+                [self.git, 'cat-file', mode],
+                cwd=self.dir,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+            self._procs[mode] = proc
+        return proc
+
+    def close(self):
+        """stop any running batch processes"""
+        for proc in self._procs.values():
+            if proc.poll() is None:
+                proc.stdin.close()
+                proc.wait()
+            proc.stdout.close()
+        self._procs = {}
+
+    def _request(self, mode, rev):
+        if '\n' in rev:
+            raise ValueError(f"invalid revision: {rev!r}")
+        proc = self._process(mode)
+        proc.stdin.write(rev.encode('utf-8') + b'\n')
+        proc.stdin.flush()
+        header = proc.stdout.readline().decode('utf-8').rstrip('\n')
+        if not header:
+            raise RuntimeError(f"git cat-file {mode} exited unexpectedly")
+        if header.endswith((' missing', ' ambiguous')):
+            # <rev> missing / <rev> ambiguous, rev may itself contain spaces
+            return None, None
+        sha, obj_type, size = header.rsplit(' ', 2)
+        info = ObjectInfo(sha, obj_type, int(size))
+        data = None
+        if mode == '--batch':
+            data = proc.stdout.read(info.size)
+            # trailing newline after the contents
+            proc.stdout.read(1)
+        return info, data
+
+    def object_info(self, rev):
+        """
+        ObjectInfo(sha, type, size) for a revision, None if it doesnt exist
+
+        :param rev: anything git rev-parse accepts, eg HEAD, refs/tags/1.0^{commit}
+        """
+        with self._lock, trace.span('cat-file --batch-check', cat='git-session', rev=rev):
+            info, _ = self._request('--batch-check', rev)
+        return info
+
+    def rev_parse(self, rev):
+        """sha of revision, None if it doesnt exist"""
+        info = self.object_info(rev)
+        return info.sha if info else None
+
+    def exists(self, rev):
+        return self.object_info(rev) is not None
+
+    def read_object(self, rev):
+        """
+        read an object
+
+        :return: (ObjectInfo, bytes) or (None, None) if it doesnt exist
+        """
+        with self._lock, trace.span('cat-file --batch', cat='git-session', rev=rev):
+            return self._request('--batch', rev)
+
+    def read_commit(self, rev):
+        """
+        parse a commit (peeling tags)
+
+        :return: CommitInfo or None if rev isnt a commit
+        """
+        info, data = self.read_object(f"{rev}^{{commit}}")
+        if info is None:
+            return None
+        headers, _, message = data.decode('utf-8', 'replace').partition('\n\n')
+        fields = {'parent': []}
+        for line in headers.splitlines():
+            key, _, value = line.partition(' ')
+            if key == 'parent':
+                fields['parent'].append(value)
+            else:
+                fields.setdefault(key, value)
+        return CommitInfo(
+            info.sha,
+            fields.get('tree'),
+            tuple(fields['parent']),
+            fields.get('author'),
+            fields.get('committer'),
+            message
+        )
+
+    def update_refs(self, updates=None, deletes=None, message=None):
+        """
+        apply ref updates atomically with a single update-ref --stdin
+
+        :param updates: iterable of (ref, new_sha) or (ref, new_sha, old_sha),
+           an old_sha of ZERO_SHA requires that the ref doesnt exist yet
+        :param deletes: iterable of ref names or (ref, old_sha) to delete
+        :param message: reflog message
+        """
+        lines = []
+        for u in (updates or []):
+            lines.append('update ' + ' '.join(u))
+        for d in (deletes or []):
+            if isinstance(d, str):
+                d = (d,)
+            lines.append('delete ' + ' '.join(d))
+        if not lines:
+            return
+        command = [self.git, 'update-ref', '--stdin']
+        if message:
+            command.extend(['-m', message])
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=self.dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        outp, err = process.communicate('\n'.join(lines).encode('utf-8') + b'\n')
+        trace.record_process(command, start, process.returncode, len(outp))
+        if process.returncode:
+            raise RuntimeError(err.decode('utf-8', 'replace').strip())
+
+    def update_ref(self, ref, sha, old_sha=None, message=None):
+        """create or move a single ref"""
+        update = (ref, sha) if old_sha is None else (ref, sha, old_sha)
+        self.update_refs([update], message=message)
+
+    def delete_ref(self, ref, message=None):
+        """delete a single ref"""
+        self.update_refs(deletes=[ref], message=message)
+
+
+_SESSIONS = {}
+
+
+def git_session(repo_dir):
+    """get the shared GitSession for a repo directory"""
+    key = os.path.abspath(repo_dir)
+    if key not in _SESSIONS:
+        _SESSIONS[key] = GitSession(key)
+    return _SESSIONS[key]
@@ -7,6 +7,12 @@ command launcher/delegator
 import sys, os, signal
 import subprocess
 
+from stratus.cache import cache_dir, read_json, write_json
+from stratus.plugins import registry, load_target
+from stratus.startup import check_profile_startup, startup_complete
+
+LAUNCH_MODES = ('subprocess', 'exec', 'inprocess')
+
 
 def python_bin_dir():
     """
@@ -25,6 +31,56 @@ def available_binaries(dirname):
     return result
 
 
+class BinaryIndex(object):
+    """
+    Cached map of command name: binary path for a bin directory.
+
+    The map is persisted in the stratus cache and only rebuilt
+    with available_binaries when the mtime of the directory changes,
+    ie when something is installed or removed.
+
+    :param dirname: bin directory to index
+    :param index_file (optional): path to persist the index to
+    """
+    def __init__(self, dirname, index_file=None):
+        self.dirname = dirname
+        self.index_file = index_file or os.path.join(cache_dir(), 'binaries.json')
+        self._binaries = None
+
+    def _mtime(self):
+        return os.stat(self.dirname).st_mtime_ns
+
+    def refresh(self):
+        """rescan the directory and persist the result"""
+        mtime = self._mtime()
+        self._binaries = available_binaries(self.dirname)
+        data = read_json(self.index_file, default={})
+        data[self.dirname] = {'mtime': mtime, 'binaries': self._binaries}
+        write_json(self.index_file, data)
+        return self._binaries
+
+    @property
+    def binaries(self):
+        """dict of command name: binary path"""
+        if self._binaries is None:
+            entry = read_json(self.index_file, default={}).get(self.dirname)
+            if entry and entry['mtime'] == self._mtime():
+                self._binaries = entry['binaries']
+            else:
+                self.refresh()
+        return self._binaries
+
+    def lookup(self, command):
+        """
+        get the binary path for command, rescanning once if the
+        cached map doesnt contain it. Returns None if not found
+        """
+        result = self.binaries.get(command)
+        if result is None or not os.path.exists(result):
+            result = self.refresh().get(command)
+        return result
+
+
 def install_signal_handlers():
     """
     Need to catch SIGINT to allow the command to be CTRL-C'ed
@@ -44,6 +100,52 @@ def run_command(cmd):
     return subprocess.call(cmd, shell=False)
 
 
+def exec_command(cmd):
+    """
+    replace the current process with the delegated command,
+    this does not return
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(cmd[0], cmd)
+
+
+def console_script(command):
+    """
+    get the console_scripts entry point target for command,
+    None if command isnt a python entry point
+    """
+    return registry().targets('console_scripts').get(command)
+
+
+def run_in_process(command, func, *args):
+    """
+    call a console script main function directly in this
+    interpreter with sys.argv set up as if it had been executed
+
+    :param command: name of the command, used as argv[0]
+    :param func: entry point callable
+    :param args: remaining cli args
+    :return: exit code
+    """
+    install_signal_handlers()
+    saved_argv = sys.argv
+    sys.argv = [command]
+    sys.argv.extend(args)
+    try:
+        result = func()
+    except SystemExit as ex:
+        result = ex.code
+    finally:
+        sys.argv = saved_argv
+    if result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    # sys.exit with a message
+    print(result, file=sys.stderr)
+    return 1
+
 
 class DelegationRule(object):
     """
@@ -54,6 +156,9 @@ class DelegationRule(object):
     :param cd (optional): Boolean indicating that the working dir should be changed
        upon execution
     :param cd_func (optional): Lambda/function to return the directory for the cd operation
+    :param mode (optional): launch mode, one of LAUNCH_MODES, defaults to the
+       mode of the Delegate. inprocess mode falls back to subprocess if the
+       command is not a python console_scripts entry point
 
     """
     def __init__(self, command=None, name=None, **options):
@@ -61,6 +166,8 @@ class DelegationRule(object):
         self.command = command
         self.bin = None
         self.cd = options.get('cd', True)
+        self.mode = options.get('mode')
+        self.entry_point = None
         self.cd_func = lambda: os.path.abspath(os.environ.get('GIT_PREFIX', '.'))
 
 
@@ -73,10 +180,14 @@ class Delegate(dict):
     that can be aggregated under eg a git alias.
 
     :param dirname: Location of binaries for delegation, defaults to python bin dir
-    :param num_pop: Number of initial cli args to pop before delegating
+    :param mode: default launch mode for rules, subprocess waits for the command,
+       exec replaces the launcher process with it, inprocess calls the
+       console_scripts main function of the command directly
     """
-    def __init__(self, dirname=None, **rules):
-        super(Delegate).__init__()
+    def __init__(self, dirname=None, mode='subprocess', **rules):
+        super(Delegate, self).__init__()
+        if mode not in LAUNCH_MODES:
+            raise RuntimeError(f"unknown launch mode: {mode}")
         for n, r in rules.items():
             if isinstance(r, str):
                 self[n] = DelegationRule(name=n, command=r)
@@ -86,6 +197,8 @@ class Delegate(dict):
             else:
                 raise RuntimeError(f"not a Delegation Rule or string: {r}")
         self._dirname = dirname or python_bin_dir()
+        self.index = BinaryIndex(self._dirname)
+        self.mode = mode
         self.skip_args = 1
 
     def __call__(self, *args):
@@ -99,7 +212,7 @@ class Delegate(dict):
         """
         if len(args) == 0 or args[0] in ('-h', '--help'):
             # missing command or help
-            print(f"Print out help here")
+            print(self.format_help())
             sys.exit(0)
         cli_args = list(args)
         command = cli_args[0]
@@ -109,11 +222,24 @@ class Delegate(dict):
             sys.exit(1)
 
         rule = self[command]
-        command_alias = rule.command
-        map = available_binaries(self._dirname)
-        rule.bin = map[command_alias]
-        self._run(rule, *cli_args[self.skip_args:])
+        if (rule.mode or self.mode) == 'inprocess':
+            rule.entry_point = console_script(rule.command)
+            if rule.entry_point is not None:
+                return self._run(rule, *cli_args[self.skip_args:])
+        rule.bin = self.index.lookup(rule.command)
+        if rule.bin is None:
+            msg = f"Cannot find binary {rule.command} for command: {command} in {self._dirname}"
+            print(msg)
+            sys.exit(127)
+        return self._run(rule, *cli_args[self.skip_args:])
+
 
+    def format_help(self):
+        """help text listing the delegated commands"""
+        lines = ["stratus commands available are:", ""]
+        lines.extend(f"  {name:<12} ({self[name].command})" for name in sorted(self))
+        lines.extend(["", "Do stratus <command> -h for more information on a particular command"])
+        return '\n'.join(lines)
 
     def _run(self, rule, *args):
 
@@ -122,9 +248,14 @@ class Delegate(dict):
             new_dir = rule.cd_func()
             os.chdir(new_dir)
         try:
-            print(f"{rule.bin} {args}")
+            mode = rule.mode or self.mode
+            if mode == 'inprocess' and rule.entry_point is not None:
+                func = load_target(rule.entry_point)
+                return run_in_process(rule.command, func, *args)
             command = [rule.bin]
             command.extend(args)
+            if mode == 'exec':
+                exec_command(command)
             exit_code = run_command(command)
         except Exception as ex:
             msg = "Exception Details:\n{}".format(ex)
@@ -138,9 +269,12 @@ class Delegate(dict):
 
 
 def main():
+    check_profile_startup('stratus.launcher:main')
+    mode = os.environ.get('STRATUS_LAUNCH_MODE', 'exec' if os.name == 'posix' else 'subprocess')
     d = Delegate(
+        mode=mode,
         release='stratus-release',
         build=DelegationRule(command='stratus-build')
     )
-    print(f"sys.argv={sys.argv}")
-    d(*sys.argv[1:])
+    startup_complete()
+    return d(*sys.argv[1:])
@@ -0,0 +1,39 @@
+"""
+lazy imports
+
+Defers importing heavy dependencies (eg GitPython) until an attribute
+of the module is actually used, so commands that never touch them
+(--help, argument errors) dont pay for the import.
+
+"""
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stand in for a module that imports it on first attribute access
+
+    :param name: fully qualified module name
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module {self.__dict__['_name']} ({state})>"
+
+
+def lazy_import(name):
+    """get a LazyModule for name"""
+    return LazyModule(name)
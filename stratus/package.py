@@ -18,7 +18,8 @@ class StatusPackage(object):
 
 
     def __init__(self, repo=None, package=None):
-        self.repo = PackageRepo(repo)
+        # a PackageRepo can be passed in to share it between packages
+        self.repo = repo if isinstance(repo, PackageRepo) else PackageRepo(repo)
         self.dir = package or os.getcwd()
         self._config = None
 
@@ -49,3 +50,4 @@ class StatusPackage(object):
         get the current version field from the setup.cfg version field
         :return:
         """
+        return self.configuration.package_version()
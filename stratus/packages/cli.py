@@ -6,6 +6,7 @@ command line interface for plugin driven package command
 
 from argparse import ArgumentParser, Namespace
 from stratus.packages.template import get_package_templates
+from stratus.startup import check_profile_startup, startup_complete
 
 
 PACKAGE_ACTIONS = {
@@ -15,14 +16,16 @@ PACKAGE_ACTIONS = {
 }
 
 
-def build_parser():
+def build_parser(templates=None):
     """
     set up the argparse parser to extract the plugin and action from the cli args
     as first two positional arguments
+    :param templates: package template mapping, looked up if not provided
     :return: argparse.ArgumentParser instance
     """
     parser = ArgumentParser("package template command suite")
-    templates = get_package_templates()
+    if templates is None:
+        templates = get_package_templates()
     parser.add_argument('template', nargs=1, help='package template handler', choices=templates.keys())
     parser.add_argument('action', nargs=1, help='action', choices=PACKAGE_ACTIONS.keys())
     return parser
@@ -37,15 +40,17 @@ def main():
 
     :return:
     """
-    handler = build_parser()
+    check_profile_startup('stratus.packages.cli:main')
+    templates = get_package_templates()
+    handler = build_parser(templates)
     opts, args = handler.parse_known_args()
     opts.template = opts.template[0]
     opts.action = opts.action[0]
-    templates = get_package_templates()
     t = opts.template
     a = opts.action
     template = templates[t]()
     template.configure_parser(a)
     template.run_parser(args)
+    startup_complete()
     action = getattr(template, a)
     action()
@@ -1,13 +1,15 @@
 import argparse
-import pkg_resources
 from argparse import Namespace
 
+from stratus.plugins import get_plugins
+
 
 def get_package_templates():
-    models = {}
-    for entry_point in pkg_resources.iter_entry_points('stratus_package_templates'):
-        models[entry_point.name] = entry_point.load()
-    return models
+    """
+    lazy mapping of template name: template class, only the
+    template that is looked up gets imported
+    """
+    return get_plugins('stratus_package_templates')
 
 
 class PackageTemplate(object):
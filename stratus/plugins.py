@@ -0,0 +1,202 @@
+"""
+plugin registry
+
+Lightweight replacement for pkg_resources entry point scanning.
+Plugin names and their import targets are read via importlib.metadata
+and persisted to a small index in the stratus cache, which is
+invalidated whenever the mtimes of the sys.path directories or of a
+distribution's entry_points.txt change (ie a distribution is installed,
+removed or its entry points edited).
+Only the plugin that is actually selected gets imported.
+
+"""
+import os
+import sys
+import time
+import importlib
+from collections.abc import Mapping
+
+from stratus.cache import cache_dir, read_json, write_json
+
+INDEX_FILE = 'plugins.json'
+MAX_ENVIRONMENTS = 8
+
+
+def _entry_points(group):
+    """
+    get entry points in a group, handling the differing
+    importlib.metadata APIs across python versions
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        import importlib_metadata as metadata
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+def path_fingerprint(paths=None):
+    """
+    cheap fingerprint of the installed distributions: the
+    mtimes of each directory on sys.path and of the
+    entry_points.txt of each distribution in them, so entry
+    points edited in place (eg develop installs) are noticed too
+
+    :param paths: list of paths, defaults to sys.path
+    :return: list of [path, mtime_ns] pairs
+    """
+    result = []
+    for p in (paths if paths is not None else sys.path):
+        if not p:
+            # cwd entry, changes far too often to be useful
+            continue
+        try:
+            result.append([p, os.stat(p).st_mtime_ns])
+            names = sorted(os.listdir(p))
+        except OSError:
+            continue
+        for name in names:
+            if not name.endswith(('.dist-info', '.egg-info')):
+                continue
+            filename = os.path.join(p, name, 'entry_points.txt')
+            try:
+                result.append([filename, os.stat(filename).st_mtime_ns])
+            except OSError:
+                continue
+    return result
+
+
+def load_target(target):
+    """
+    import and return the object referenced by a
+    module.path:attr.path entry point target string
+    """
+    module_name, _, attrs = target.partition(':')
+    obj = importlib.import_module(module_name.strip())
+    for attr in filter(None, attrs.strip().split('.')):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class PluginRegistry(object):
+    """
+    Index of plugin name: target for entry point groups, cached
+    on disk and refreshed when installed distributions change
+
+    :param index_file: path to the index file, defaults to the stratus cache dir
+    """
+    def __init__(self, index_file=None):
+        self.index_file = index_file or os.path.join(cache_dir(), INDEX_FILE)
+        self._index = None
+
+    def _load_index(self):
+        # one entry per interpreter + sys.path so that different
+        # environments sharing the cache dont invalidate each other
+        self._key = '|'.join([sys.executable] + [p for p in sys.path if p])
+        fingerprint = path_fingerprint()
+        self._data = read_json(self.index_file, default={})
+        entry = self._data.get(self._key)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            entry = {'fingerprint': fingerprint, 'groups': {}}
+        self._index = entry
+
+    def _save_index(self):
+        data = {k: v for k, v in self._data.items() if k != self._key}
+        # keep the most recently updated environments only
+        keep = sorted(data, key=lambda k: data[k].get('updated', 0))[-(MAX_ENVIRONMENTS - 1):]
+        data = {k: data[k] for k in keep}
+        self._index['updated'] = time.time()
+        data[self._key] = self._index
+        write_json(self.index_file, data)
+
+    def targets(self, group):
+        """
+        dict of plugin name: target string for the group
+
+        :param group: entry point group name
+        """
+        if self._index is None:
+            self._load_index()
+        groups = self._index['groups']
+        if group not in groups:
+            groups[group] = {ep.name: ep.value for ep in _entry_points(group)}
+            self._save_index()
+        return groups[group]
+
+    def refresh(self, group):
+        """
+        rescan the entry points of a group, ignoring the cached index
+
+        :param group: entry point group name
+        :return: dict of plugin name: target string
+        """
+        if self._index is None:
+            self._load_index()
+        self._index['groups'].pop(group, None)
+        return self.targets(group)
+
+    def names(self, group):
+        """sorted list of plugin names in the group"""
+        return sorted(self.targets(group))
+
+    def load(self, group, name):
+        """
+        import and return the named plugin from the group
+
+        :param group: entry point group name
+        :param name: plugin name
+        :return: loaded plugin object
+        """
+        return load_target(self.targets(group)[name])
+
+    def plugins(self, group):
+        """lazy name: plugin mapping for the group"""
+        return LazyPlugins(self, group)
+
+
+class LazyPlugins(Mapping):
+    """
+    Read only mapping of plugin name to plugin object that only
+    imports a plugin when it is looked up
+    """
+    def __init__(self, registry, group):
+        self._registry = registry
+        self._group = group
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            if name not in self._registry.targets(self._group):
+                # the index may predate the plugin, rescan once before failing
+                self._registry.refresh(self._group)
+            self._loaded[name] = self._registry.load(self._group, name)
+        return self._loaded[name]
+
+    def __contains__(self, name):
+        return name in self._registry.targets(self._group)
+
+    def __iter__(self):
+        return iter(self._registry.names(self._group))
+
+    def __len__(self):
+        return len(self._registry.targets(self._group))
+
+
+_REGISTRY = None
+
+
+def registry():
+    """get the shared PluginRegistry instance"""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = PluginRegistry()
+    return _REGISTRY
+
+
+def get_plugins(group):
+    """
+    get a lazy mapping of plugin name: plugin for an entry point group
+    """
+    return registry().plugins(group)
@@ -0,0 +1,222 @@
+"""
+ref snapshot
+
+Reads the refs of a git repo (loose ref files plus packed-refs) once
+and indexes them by name, so that branch/tag/remote lookups dont
+rebuild GitPython ref lists on every access.
+
+The snapshot records the mtimes of packed-refs and of every refs
+directory it read, and reloads only when one of those changes. Callers
+that mutate refs themselves can patch or invalidate the snapshot
+directly. A snapshot can be shared between threads, loads and
+patches are serialised on a lock.
+
+"""
+import os
+import threading
+from collections.abc import Mapping
+
+PACKED_REFS = 'packed-refs'
+HEADS = 'refs/heads/'
+TAGS = 'refs/tags/'
+REMOTES = 'refs/remotes/'
+
+
+class RefSnapshot(object):
+    """
+    Snapshot of ref name: sha for a git directory
+
+    :param git_dir: path to the .git (common) directory of the repo
+    """
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._refs = None
+        self._peeled = None
+        self._stamp = None
+        self._dirs = []
+        self._prefixed = {}
+        self._lock = threading.RLock()
+
+    def _packed_refs(self):
+        """parse packed-refs into refs and peeled tag dicts"""
+        refs = {}
+        peeled = {}
+        path = os.path.join(self.git_dir, PACKED_REFS)
+        if not os.path.exists(path):
+            return refs, peeled
+        last = None
+        with open(path, 'r') as handle:
+            for line in handle:
+                if line.startswith('#'):
+                    continue
+                line = line.rstrip('\n')
+                if line.startswith('^'):
+                    # peeled commit of the previous annotated tag
+                    if last is not None:
+                        peeled[last] = line[1:]
+                    continue
+                sha, _, name = line.partition(' ')
+                if name:
+                    refs[name] = sha
+                    last = name
+        return refs, peeled
+
+    def _loose_refs(self, refs):
+        """walk the refs dir, loose refs take precedence over packed"""
+        symbolic = {}
+        dirs = []
+        root = os.path.join(self.git_dir, 'refs')
+        for dirpath, _, filenames in os.walk(root):
+            dirs.append(dirpath)
+            for f in filenames:
+                path = os.path.join(dirpath, f)
+                name = os.path.relpath(path, self.git_dir).replace(os.sep, '/')
+                try:
+                    with open(path, 'r') as handle:
+                        content = handle.read().strip()
+                except OSError:
+                    continue
+                if content.startswith('ref: '):
+                    symbolic[name] = content[5:]
+                elif content:
+                    refs[name] = content
+        for name, target in symbolic.items():
+            if target in refs:
+                refs[name] = refs[target]
+        return dirs
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _current_stamp(self):
+        paths = [os.path.join(self.git_dir, PACKED_REFS)]
+        paths.extend(self._dirs)
+        return [self._mtime(p) for p in paths]
+
+    def load(self):
+        """(re)read all refs from disk"""
+        with self._lock:
+            refs, peeled = self._packed_refs()
+            self._dirs = self._loose_refs(refs)
+            self._refs = refs
+            self._peeled = peeled
+            self._prefixed = {}
+            self._stamp = self._current_stamp()
+
+    def is_stale(self):
+        """True if the snapshot needs to be (re)loaded"""
+        return self._refs is None or self._stamp != self._current_stamp()
+
+    def invalidate(self):
+        """drop the snapshot, next access reloads"""
+        with self._lock:
+            self._refs = None
+            self._prefixed = {}
+
+    @property
+    def refs(self):
+        """dict of full ref name: sha"""
+        with self._lock:
+            if self.is_stale():
+                self.load()
+            return self._refs
+
+    def get(self, name, default=None):
+        """sha of the full ref name"""
+        return self.refs.get(name, default)
+
+    def peeled(self, name):
+        """commit sha a ref points to, peeling annotated tags if known"""
+        refs = self.refs
+        return self._peeled.get(name, refs.get(name))
+
+    def names(self, prefix):
+        """
+        dict of short name: sha for refs under prefix,
+        eg names('refs/tags/')
+        """
+        with self._lock:
+            refs = self.refs
+            if prefix not in self._prefixed:
+                n = len(prefix)
+                self._prefixed[prefix] = {
+                    k[n:]: v for k, v in refs.items() if k.startswith(prefix)
+                }
+            return self._prefixed[prefix]
+
+    def heads(self):
+        return self.names(HEADS)
+
+    def tags(self):
+        return self.names(TAGS)
+
+    def remote_refs(self, remote):
+        """dict of branch name: sha for a remote"""
+        return self.names(f"{REMOTES}{remote}/")
+
+    def update(self, name, sha):
+        """
+        write-through patch for a ref the caller has just created or moved.
+        The stamp is refreshed so that the callers own write doesnt
+        trigger a full reload, this assumes nothing else changed the refs
+        since the snapshot was last read.
+        """
+        with self._lock:
+            if self._refs is None:
+                return
+            self._refs[name] = sha
+            self._peeled.pop(name, None)
+            self._prefixed = {}
+            self._refresh_stamp(name)
+
+    def delete(self, name):
+        """write-through patch for a ref the caller has just deleted"""
+        with self._lock:
+            if self._refs is None:
+                return
+            self._refs.pop(name, None)
+            self._peeled.pop(name, None)
+            self._prefixed = {}
+            self._refresh_stamp(name)
+
+    def _refresh_stamp(self, name):
+        # new directories may have been created for the ref
+        parent = os.path.dirname(os.path.join(self.git_dir, *name.split('/')))
+        while parent.startswith(os.path.join(self.git_dir, 'refs')) and parent not in self._dirs:
+            if os.path.isdir(parent):
+                self._dirs.append(parent)
+            parent = os.path.dirname(parent)
+        self._stamp = self._current_stamp()
+
+
+class RefMap(Mapping):
+    """
+    Read only mapping of short ref name: GitPython ref object over a
+    RefSnapshot prefix. Ref objects are only constructed on lookup.
+
+    :param snapshot: RefSnapshot instance
+    :param prefix: full ref prefix, eg refs/heads/
+    :param factory: callable taking the full ref name returning the ref object
+    """
+    def __init__(self, snapshot, prefix, factory):
+        self._snapshot = snapshot
+        self._prefix = prefix
+        self._factory = factory
+        self._names = snapshot.names(prefix)
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        return self._factory(f"{self._prefix}{name}")
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
@@ -0,0 +1,117 @@
+"""
+batch releases
+
+Runs a release action across every package in a monorepo. All the
+packages share one PackageRepo (and so one ref snapshot, git session
+and tag index) instead of each building their own.
+
+The new and build actions run for several packages at once, ref and
+HEAD mutations on the shared repo are serialised by its ref_lock.
+Other actions (publish, closeout) run one package at a time.
+
+"""
+import os
+import time
+import collections
+
+from stratus import trace
+
+PACKAGE_MARKERS = ('setup.cfg', 'setup.py')
+
+# actions that only read git state and can run for packages in parallel
+CONCURRENT_ACTIONS = ('new', 'build')
+
+BatchResult = collections.namedtuple('BatchResult', 'package ok duration result error')
+
+
+class BatchReport(dict):
+    """
+    dict of package dir: BatchResult for a batch action
+    """
+    @property
+    def ok(self):
+        return all(r.ok for r in self.values())
+
+    @property
+    def failed(self):
+        return [r for r in self.values() if not r.ok]
+
+    def summary(self, root=None):
+        """human readable report, one line per package"""
+        lines = []
+        for name in sorted(self):
+            r = self[name]
+            label = os.path.relpath(name, root) if root else name
+            line = f"{label:<40} {'ok' if r.ok else 'failed':<8} {r.duration:7.2f}s"
+            if r.error:
+                line = f"{line} {r.error.splitlines()[0]}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def discover_packages(repo, markers=PACKAGE_MARKERS):
+    """
+    find the package dirs in a repo: dirs with a tracked setup.cfg or
+    setup.py, listed from the index so ignored and untracked dirs
+    (venvs, build output) are never walked
+
+    :param repo: PackageRepo
+    :return: sorted list of absolute package dirs
+    """
+    from stratus.shell_commands import command_records
+    dirs = set()
+    for path in command_records(['git', 'ls-files', '-z'], cwd=repo.dir):
+        dirname, _, filename = path.rpartition('/')
+        if filename in markers:
+            dirs.add(os.path.normpath(os.path.join(repo.dir, dirname)))
+    return sorted(dirs)
+
+
+def run_package(model_class, action, args, package):
+    """
+    run one action for one package
+
+    :return: BatchResult
+    """
+    start = time.perf_counter()
+    try:
+        model = model_class()
+        model.package = package
+        model.configure_parser(action)
+        model.run_parser(args)
+        with trace.phase(f"{os.path.basename(package.dir)} {action}"):
+            result = getattr(model, action)()
+    except Exception as ex:
+        return BatchResult(package.dir, False, time.perf_counter() - start, None, str(ex) or repr(ex))
+    return BatchResult(package.dir, True, time.perf_counter() - start, result, None)
+
+
+def run_batch(model_class, action, args, repo_dir=None, packages=None, jobs=4):
+    """
+    run a release action for every package in the repo
+
+    :param model_class: ReleaseModel subclass
+    :param action: new, build, publish or closeout
+    :param args: remaining command line args for the model parser
+    :param repo_dir: repo dir, defaults to the repo containing the cwd
+    :param packages: package dirs, defaults to discover_packages()
+    :param jobs: packages to run at once for the concurrent actions
+    :return: BatchReport
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from stratus.package import StatusPackage
+    from stratus.repository import PackageRepo
+    repo = PackageRepo(repo_dir)
+    if packages is None:
+        packages = discover_packages(repo)
+    packages = [StatusPackage(repo, os.path.abspath(p)) for p in packages]
+    workers = jobs if action in CONCURRENT_ACTIONS else 1
+    report = BatchReport()
+    if not packages:
+        return report
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(packages)))) as pool:
+        futures = [pool.submit(run_package, model_class, action, args, p) for p in packages]
+        for future in futures:
+            result = future.result()
+            report[result.package] = result
+    return report
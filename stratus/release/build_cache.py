@@ -0,0 +1,123 @@
+"""
+release build cache
+
+Content addressed cache of built release artifacts. Each build target
+is keyed by the git tree hash of the package dir plus the target
+config (kind and interpreter), so re-running a build on an unchanged
+tree (eg a CI retry) restores the artifacts instead of rebuilding them.
+
+Layout under the stratus cache dir:
+
+    builds/objects/<sha256>        artifact contents
+    builds/targets/<key>.json      manifest of artifact names and digests
+    builds/stats.json              hit/miss counts and total time saved
+
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from stratus.cache import cache_dir, read_json, write_json, atomic_write
+
+# bump if the build commands change in a way that affects the artifacts
+CACHE_VERSION = 1
+
+_STATS_LOCK = threading.Lock()
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache(object):
+    """
+    Cache of built artifacts keyed by tree hash and target
+
+    :param root: cache directory, defaults to the stratus cache builds dir
+    """
+    def __init__(self, root=None):
+        self.root = root or cache_dir('builds')
+        self.objects = os.path.join(self.root, 'objects')
+        self.targets = os.path.join(self.root, 'targets')
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.targets, exist_ok=True)
+        self.stats_file = os.path.join(self.root, 'stats.json')
+
+    def key(self, tree, target):
+        """
+        cache key for a target built from a tree
+
+        :param tree: git tree sha of the package dir
+        :param target: BuildTarget
+        """
+        from stratus.build.environment import interpreter_id
+        config = [CACHE_VERSION, tree, target.kind, interpreter_id(target.python)]
+        return hashlib.sha256(json.dumps(config).encode('utf-8')).hexdigest()
+
+    def _manifest(self, key):
+        return os.path.join(self.targets, f"{key}.json")
+
+    def _object(self, digest):
+        return os.path.join(self.objects, digest)
+
+    def get(self, key):
+        """manifest dict for key, None if it isnt cached or an artifact is missing"""
+        manifest = read_json(self._manifest(key))
+        if manifest is None:
+            return None
+        if not all(os.path.exists(self._object(d)) for _, d in manifest['artifacts']):
+            return None
+        return manifest
+
+    def restore(self, manifest, dist_dir):
+        """
+        link or copy the artifacts for a manifest into dist_dir
+
+        :return: list of artifact paths
+        """
+        paths = []
+        for name, digest in manifest['artifacts']:
+            dest = os.path.join(dist_dir, name)
+            if os.path.exists(dest):
+                os.unlink(dest)
+            try:
+                os.link(self._object(digest), dest)
+            except OSError:
+                shutil.copy2(self._object(digest), dest)
+            paths.append(dest)
+        return paths
+
+    def put(self, key, artifacts, duration, **info):
+        """
+        store built artifacts
+
+        :param artifacts: list of artifact paths
+        :param duration: seconds the build took, reported as saved on a hit
+        """
+        entries = []
+        for path in artifacts:
+            digest = file_digest(path)
+            obj = self._object(digest)
+            if not os.path.exists(obj):
+                tmp = f"{obj}.tmp-{os.getpid()}"
+                shutil.copy2(path, tmp)
+                os.replace(tmp, obj)
+            entries.append([os.path.basename(path), digest])
+        manifest = dict(info, artifacts=entries, duration=duration)
+        atomic_write(self._manifest(key), json.dumps(manifest))
+
+    def record(self, hits=0, misses=0, saved=0.0):
+        """add to the persisted hit/miss/time saved totals, returns the totals"""
+        with _STATS_LOCK:
+            stats = read_json(self.stats_file, default={})
+            stats['hits'] = stats.get('hits', 0) + hits
+            stats['misses'] = stats.get('misses', 0) + misses
+            stats['saved'] = stats.get('saved', 0.0) + saved
+            write_json(self.stats_file, stats)
+        return stats
@@ -0,0 +1,278 @@
+"""
+release artifact builder
+
+Builds the release artifacts for a package (an sdist plus wheels for
+one or more interpreters) in parallel. Each target runs in a process
+pool worker against its own copy of the source tree, so setuptools
+build/ and egg-info dirs never collide, and writes its output to a
+per-target log file. Total build time approaches that of the slowest
+target rather than the sum of all of them.
+
+Targets are given as strings:
+
+ - sdist
+ - wheel (built with the current interpreter)
+ - wheel:python3.10 (built with another interpreter)
+
+Wheel targets that produce the same file, eg universal wheels (setup.cfg
+[bdist_wheel] universal) or pure python py3-none-any wheels built by
+several interpreters, are only collected once: universal wheels are
+built for one wheel target only, and any other target whose
+output has the same filename as an earlier target is reported as a
+duplicate of it instead of overwriting it.
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import collections
+import configparser
+
+from stratus import trace
+
+BuildTarget = collections.namedtuple('BuildTarget', 'name kind python')
+# saved is the build time a cache hit avoided, 0 for targets that were built,
+# duplicate is the name of the earlier target that produced the same artifacts
+TargetResult = collections.namedtuple('TargetResult', 'target ok artifacts log duration saved duplicate')
+
+DEFAULT_TARGETS = ('sdist', 'wheel')
+
+# not copied into the isolated build dirs
+IGNORE_PATTERNS = ('.git', '*.egg-info', '__pycache__', '.tox')
+IGNORE_TOP_LEVEL = ('build', 'dist', 'venv', '.venv', 'wheelhouse')
+
+
+def parse_target(value, python=None):
+    """
+    parse a target string into a BuildTarget
+
+    :param value: sdist, wheel or wheel:<python binary>
+    :param python: default python binary
+    """
+    kind, _, interpreter = value.partition(':')
+    if kind not in ('sdist', 'wheel'):
+        raise ValueError(f"unknown build target {value!r}, expected sdist, wheel or wheel:<python>")
+    interpreter = interpreter or python or sys.executable
+    name = kind if value == kind else f"{kind}-{os.path.basename(interpreter)}"
+    return BuildTarget(name, kind, interpreter)
+
+
+def universal_wheel(source_dir):
+    """True if setup.cfg in source_dir configures universal wheels"""
+    parser = configparser.RawConfigParser()
+    parser.read(os.path.join(source_dir, 'setup.cfg'))
+    for section in ('bdist_wheel', 'wheel'):
+        value = parser.get(section, 'universal', fallback='')
+        if value.strip().lower() in ('1', 'true', 'yes', 'on'):
+            return True
+    return False
+
+
+def _ignore(source_dir):
+    ignore = shutil.ignore_patterns(*IGNORE_PATTERNS)
+
+    def ignored(dirname, names):
+        skip = ignore(dirname, names)
+        if os.path.samefile(dirname, source_dir):
+            skip.update(n for n in names if n in IGNORE_TOP_LEVEL)
+        return skip
+    return ignored
+
+
+def target_command(target, dist_dir):
+    """command to build target in the current dir into dist_dir"""
+    if target.kind == 'sdist':
+        return [target.python, 'setup.py', '-q', 'sdist', '--dist-dir', dist_dir]
+    return [
+        target.python, '-m', 'pip', 'wheel', '--disable-pip-version-check',
+        '--no-deps', '--wheel-dir', dist_dir, '.'
+    ]
+
+
+def build_target(target, source_dir, dist_dir, log_dir):
+    """
+    build one target in an isolated copy of source_dir, run in a
+    process pool worker. The artifacts are left in a staging dir in
+    dist_dir for build_targets to collect.
+
+    :return: TargetResult, artifacts are the paths of the staged files
+    """
+    start = time.perf_counter()
+    log = os.path.join(log_dir, f"{target.name}.log")
+    work_dir = tempfile.mkdtemp(prefix=f"stratus-build-{target.name}-")
+    out = tempfile.mkdtemp(dir=dist_dir, prefix=f".{target.name}-")
+    artifacts = []
+    try:
+        src = os.path.join(work_dir, 'src')
+        shutil.copytree(source_dir, src, symlinks=True, ignore=_ignore(source_dir))
+        command = target_command(target, out)
+        with open(log, 'wb') as handle:
+            handle.write(f"$ {' '.join(command)}\n".encode('utf-8'))
+            handle.flush()
+            process = subprocess.run(command, cwd=src, stdout=handle, stderr=subprocess.STDOUT)
+        if process.returncode == 0:
+            artifacts = [os.path.join(out, f) for f in sorted(os.listdir(out))]
+        return TargetResult(target, bool(artifacts), artifacts, log, time.perf_counter() - start, 0.0, None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not artifacts:
+            shutil.rmtree(out, ignore_errors=True)
+
+
+def _collect(result, dist_dir, produced):
+    """
+    move a built or restored targets staged artifacts into dist_dir,
+    dropping any with the same filename as an artifact of an earlier target
+
+    :param produced: dict of filename: target name, updated in place
+    :return: TargetResult with the final artifact paths
+    """
+    artifacts = []
+    duplicate = None
+    for path in result.artifacts:
+        name = os.path.basename(path)
+        if name in produced:
+            duplicate = produced[name]
+            continue
+        dest = os.path.join(dist_dir, name)
+        os.replace(path, dest)
+        produced[name] = result.target.name
+        artifacts.append(dest)
+    if result.artifacts:
+        shutil.rmtree(os.path.dirname(result.artifacts[0]), ignore_errors=True)
+    return result._replace(artifacts=artifacts, duplicate=None if artifacts else duplicate or result.duplicate)
+
+
+class BuildReport(object):
+    """
+    Combined result of a multi target build
+
+    :param results: list of TargetResult
+    :param duration: wall clock seconds for the whole build
+    """
+    def __init__(self, results, duration):
+        self.results = results
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return all(r.ok for r in self.results)
+
+    @property
+    def artifacts(self):
+        return [a for r in self.results for a in r.artifacts]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def saved(self):
+        return sum(r.saved for r in self.results)
+
+    def summary(self):
+        lines = []
+        for r in self.results:
+            status = 'cached' if r.saved else 'ok' if r.ok else 'FAILED'
+            if r.duplicate:
+                built = f"same artifacts as {r.duplicate}"
+            else:
+                built = ', '.join(os.path.basename(a) for a in r.artifacts) or f"see {r.log}"
+            lines.append(f"{r.target.name:<24}{status:<8}{r.duration:>7.1f}s  {built}")
+        serial = sum(r.duration for r in self.results)
+        lines.append(
+            f"{len(self.results)} targets, {len(self.artifacts)} artifacts built in {self.duration:.1f}s "
+            f"({serial:.1f}s if built one after another)"
+        )
+        if self.saved:
+            cached = sum(1 for r in self.results if r.saved)
+            lines.append(f"{cached} targets restored from the build cache, saved {self.saved:.1f}s")
+        return '\n'.join(lines)
+
+
+def build_targets(targets, source_dir, dist_dir='dist', log_dir=None, jobs=None, cache=None, tree=None):
+    """
+    build targets in parallel
+
+    :param targets: list of BuildTarget
+    :param source_dir: package dir containing setup.py
+    :param dist_dir: dir to collect the artifacts in
+    :param log_dir: dir for the per-target logs, defaults to <dist_dir>/logs
+    :param jobs: max parallel builds, defaults to one per target
+    :param cache: optional BuildCache to restore unchanged targets from
+    :param tree: git tree hash of source_dir, required to use the cache
+    :return: BuildReport
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    start = time.perf_counter()
+    source_dir = os.path.abspath(source_dir)
+    dist_dir = os.path.abspath(dist_dir)
+    log_dir = os.path.abspath(log_dir or os.path.join(dist_dir, 'logs'))
+    os.makedirs(dist_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    use_cache = cache is not None and tree is not None
+    results = {}
+    keys = {}
+    pending = []
+    wheels = [t for t in targets if t.kind == 'wheel']
+    if len(wheels) > 1 and universal_wheel(source_dir):
+        # every interpreter builds the same py2.py3-none-any wheel,
+        # build it once, with the current interpreter if that is a target
+        primary = next((t for t in wheels if t.python == sys.executable), wheels[0])
+        for target in wheels:
+            if target != primary:
+                results[target] = TargetResult(target, True, [], None, 0.0, 0.0, primary.name)
+    for target in targets:
+        if target in results:
+            continue
+        if use_cache:
+            keys[target] = cache.key(tree, target)
+            manifest = cache.get(keys[target])
+            if manifest is not None:
+                # staged like a fresh build so _collect dedups restored artifacts too
+                restore_start = time.perf_counter()
+                out = tempfile.mkdtemp(dir=dist_dir, prefix=f".{target.name}-")
+                try:
+                    artifacts = cache.restore(manifest, out)
+                except OSError:
+                    shutil.rmtree(out, ignore_errors=True)
+                    pending.append(target)
+                    continue
+                duration = time.perf_counter() - restore_start
+                results[target] = TargetResult(
+                    target, True, artifacts, None, duration,
+                    max(manifest['duration'] - duration, 0.0), None
+                )
+                continue
+        pending.append(target)
+
+    if pending:
+        jobs = min(jobs or len(pending), len(pending))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(build_target, t, source_dir, dist_dir, log_dir) for t in pending]
+            for future in futures:
+                result = future.result()
+                trace.record_process(
+                    target_command(result.target, dist_dir),
+                    time.perf_counter() - result.duration,
+                    int(not result.ok), 0
+                )
+                if use_cache and result.ok:
+                    cache.put(
+                        keys[result.target], result.artifacts, result.duration,
+                        tree=tree, target=result.target.name
+                    )
+                results[result.target] = result
+
+    # collect in target order so the first target producing a file keeps it
+    produced = {}
+    for target in targets:
+        results[target] = _collect(results[target], dist_dir, produced)
+
+    report = BuildReport([results[t] for t in targets], time.perf_counter() - start)
+    if use_cache:
+        cache.record(hits=len(keys) - len(pending), misses=len(pending), saved=report.saved)
+    return report
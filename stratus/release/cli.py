@@ -6,8 +6,11 @@ Maps the release plugin and action to the plugin code and forward rest of option
 and invoke the action
 
 """
+import os
 from argparse import ArgumentParser, Namespace
+from stratus import trace
 from stratus.release.model import get_release_models
+from stratus.startup import check_profile_startup, startup_complete
 
 
 RELEASE_ACTIONS = {
@@ -18,16 +21,30 @@ RELEASE_ACTIONS = {
 }
 
 
-def build_parser():
+def build_parser(models=None):
     """
     set up the argparse parser to extract the plugin and action from the cli args
     as first two positional arguments
+    :param models: release model mapping, looked up if not provided
     :return: argparse.ArgumentParser instance
     """
     parser = ArgumentParser("release model command suite")
-    models = get_release_models()
+    if models is None:
+        models = get_release_models()
     parser.add_argument('model', nargs=1, help='release model', choices=models.keys())
     parser.add_argument('action', nargs=1, help='action', choices=RELEASE_ACTIONS.keys())
+    parser.add_argument(
+        '--batch', action='store_true', default=False,
+        help='run the action for every package in the repo (monorepos)'
+    )
+    parser.add_argument(
+        '--batch-jobs', type=int, default=4,
+        help='packages to run at once in batch mode for the new and build actions'
+    )
+    parser.add_argument(
+        '--trace', default=None, metavar='FILE',
+        help=f'write a Chrome trace-event file of git calls and action phases (or set {trace.TRACE_ENV})'
+    )
     return parser
 
 
@@ -40,15 +57,29 @@ def main():
 
     :return:
     """
-    handler = build_parser()
+    check_profile_startup('stratus.release.cli:main')
+    models = get_release_models()
+    handler = build_parser(models)
     opts, args = handler.parse_known_args()
     opts.model = opts.model[0]
     opts.action = opts.action[0]
-    models = get_release_models()
     m = opts.model
     a = opts.action
-    model = models[m]()
-    model.configure_parser(a)
-    model.run_parser(args)
+    if opts.trace:
+        trace.enable(opts.trace)
+    if opts.batch:
+        from stratus.release.batch import run_batch
+        startup_complete()
+        with trace.phase(f"batch {m} {a}"):
+            report = run_batch(models[m], a, args, jobs=opts.batch_jobs)
+        print(report.summary(root=os.getcwd()))
+        return 0 if report.ok else 1
+    with trace.phase('load model', model=m):
+        model = models[m]()
+    with trace.phase('parse options', model=m, action=a):
+        model.configure_parser(a)
+        model.run_parser(args)
+    startup_complete()
     action = getattr(model, a)
-    action()
+    with trace.phase(f"{m} {a}"):
+        action()
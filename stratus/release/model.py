@@ -2,15 +2,19 @@
 release model API
 
 """
+import os
 import argparse
-import pkg_resources
 from argparse import Namespace
 
+from stratus.plugins import get_plugins
+from stratus.versions import Version
+
 def get_release_models():
-    models = {}
-    for entry_point in pkg_resources.iter_entry_points('stratus_release_models'):
-        models[entry_point.name] = entry_point.load()
-    return models
+    """
+    lazy mapping of release model name: model class, only the
+    model that is looked up gets imported
+    """
+    return get_plugins('stratus_release_models')
 
 
 
@@ -24,6 +28,23 @@ class ReleaseModel(object):
         self.subcommand = None
         self.opts = Namespace()
         self.args = []
+        self._package = None
+
+    @property
+    def package(self):
+        """StatusPackage the model acts on, defaults to the current package"""
+        if self._package is None:
+            from stratus.package import current_package
+            self._package = current_package()
+        return self._package
+
+    @package.setter
+    def package(self, value):
+        self._package = value
+
+    def package_path(self, path):
+        """resolve a path option relative to the package dir"""
+        return os.path.join(self.package.dir, path)
 
     def configure_parser(self, action):
         self.parser = argparse.ArgumentParser()
@@ -38,10 +59,26 @@ class ReleaseModel(object):
         pass
 
     def customize_parser_build(self, p):
-        pass
+        p.add_argument(
+            '-t', '--target', dest='targets', action='append', default=None,
+            help='build target: sdist, wheel or wheel:<python>, can be repeated (default: sdist and wheel)'
+        )
+        p.add_argument('--dist-dir', default='dist', help='directory to write artifacts to')
+        p.add_argument('-j', '--jobs', type=int, default=None, help='max parallel target builds')
+        p.add_argument(
+            '--no-cache', dest='use_cache', action='store_false', default=True,
+            help='always rebuild, dont restore unchanged targets from the build cache'
+        )
 
     def customize_parser_publish(self, p):
-        pass
+        p.add_argument(
+            '-r', '--repository', default='pypi',
+            help='upload url or name of a repository section in ~/.pypirc'
+        )
+        p.add_argument('--dist-dir', default='dist', help='directory containing the artifacts to upload')
+        p.add_argument('--index-url', default=None, help='simple index url used to skip files already uploaded')
+        p.add_argument('-j', '--jobs', type=int, default=4, help='max concurrent uploads')
+        p.add_argument('--retries', type=int, default=4, help='retries per file on connection errors and 5xx')
 
     def customize_parser_closeout(self, p):
         pass
@@ -49,14 +86,95 @@ class ReleaseModel(object):
     def run_parser(self, args):
         self.opts = self.parser.parse_args(args)
 
+    def next_version(self, part='micro', repo=None, tag_prefix=''):
+        """
+        work out the next release version by bumping the latest
+        semver tag in the repo, using the repos tag index
+
+        :param part: major, minor or micro
+        :param repo: PackageRepo, defaults to the current package repo
+        :param tag_prefix: prefix of version tags, eg 'v'
+        :return: Version
+        """
+        if repo is None:
+            repo = self.package.repo
+        latest = repo.latest_version(prefix=tag_prefix)
+        if latest is None:
+            latest = Version(0, 0, 0)
+        bump = {
+            'major': latest.bump_major,
+            'minor': latest.bump_minor,
+            'micro': latest.bump_patch,
+        }[part]
+        return bump()
+
     def new(self):
         pass
 
+    def build_targets(self):
+        """BuildTargets for the build action from the parsed options"""
+        from stratus.release.builder import DEFAULT_TARGETS, parse_target
+        targets = getattr(self.opts, 'targets', None) or DEFAULT_TARGETS
+        return [parse_target(t) for t in targets]
+
     def build(self):
-        pass
+        """
+        build the release artifacts, all targets are built in parallel
+        in isolated build dirs with a log per target
+
+        :return: BuildReport
+        """
+        from stratus.release.builder import build_targets, IGNORE_TOP_LEVEL
+        package = self.package
+        dist_dir = self.package_path(getattr(self.opts, 'dist_dir', 'dist'))
+        cache = tree = None
+        if getattr(self.opts, 'use_cache', True):
+            from stratus.release.build_cache import BuildCache
+            cache = BuildCache()
+            # artifacts written into the package dir mustnt change its tree hash
+            exclude = set(IGNORE_TOP_LEVEL)
+            exclude.add(os.path.relpath(os.path.abspath(dist_dir), package.dir))
+            tree = package.repo.tree_hash(package.dir, exclude=sorted(exclude))
+        report = build_targets(
+            self.build_targets(),
+            package.dir,
+            dist_dir=dist_dir,
+            jobs=getattr(self.opts, 'jobs', None),
+            cache=cache,
+            tree=tree
+        )
+        print(report.summary())
+        if not report.ok:
+            raise RuntimeError(
+                'build failed for: ' + ', '.join(r.target.name for r in report.failed)
+            )
+        return report
 
     def publish(self):
-        pass
+        """
+        upload the artifacts in the dist dir, files already on the
+        index are skipped so an interrupted publish can be re-run
+
+        :return: PublishReport
+        """
+        from stratus.release.publish import Publisher, find_artifacts, repository_config
+        url, username, password = repository_config(getattr(self.opts, 'repository', 'pypi'))
+        publisher = Publisher(
+            url, username, password,
+            index_url=getattr(self.opts, 'index_url', None),
+            concurrency=getattr(self.opts, 'jobs', 4),
+            retries=getattr(self.opts, 'retries', 4)
+        )
+        try:
+            report = publisher.publish(
+                find_artifacts(self.package_path(getattr(self.opts, 'dist_dir', 'dist')))
+            )
+        finally:
+            publisher.close()
+        print(report.summary())
+        if not report.ok:
+            raise RuntimeError('publish failed for: ' + ', '.join(r.filename for r in report.failed))
+        return report
 
 
     def closeout(self):
@@ -11,7 +11,7 @@ class Development(ReleaseModel):
         p.add_argument('--tag-prefix', default='dev')
 
     def customize_parser_build(self, p):
-        pass
+        super(Development, self).customize_parser_build(p)
 
     def new(self):
         print(vars(self.opts))
\ No newline at end of file
@@ -1,6 +1,8 @@
 
 
 
+import argparse
+
 from stratus.release.model import ReleaseModel
 
 
@@ -15,8 +17,12 @@ class Gitflow(ReleaseModel):
         p.add_argument('--stay-on-branch', action='store_true', default=False, help='stay on new release branch')
 
     def customize_parser_build(self, p):
-        p.add_argument('--distribution', default=None)
+        super(Gitflow, self).customize_parser_build(p)
+        # older spelling of --target
+        p.add_argument('--distribution', dest='targets', action='append', help=argparse.SUPPRESS)
 
     def new(self):
         print(vars(self.opts))
+        part = 'major' if self.opts.major else 'minor' if self.opts.minor else 'micro'
+        print(f"next version: {self.next_version(part)}")
 
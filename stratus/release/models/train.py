@@ -8,7 +8,7 @@ class Train(ReleaseModel):
         """hook to add parser options for new command"""
 
     def customize_parser_build(self, p):
-        pass
+        super(Train, self).customize_parser_build(p)
 
     def new(self):
         print(vars(self.opts))
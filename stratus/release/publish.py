@@ -0,0 +1,462 @@
+"""
+release publishing
+
+Uploads release artifacts to a package index using the legacy upload
+API (the one PyPI, devpi and pypiserver accept), with:
+
+ - a pool of keep-alive HTTP connections per host shared by the uploads
+ - a bounded number of concurrent uploads
+ - retry with exponential backoff on connection errors, 429 and 5xx
+ - skipping of files already on the index, checked against the sha256
+   hashes on the simple index page for the project, so an interrupted
+   publish can just be re-run
+
+Repositories are given as a URL or the name of a section in ~/.pypirc.
+Credentials come from the .pypirc section or the STRATUS_PUBLISH_USERNAME /
+STRATUS_PUBLISH_PASSWORD (or TWINE_USERNAME / TWINE_PASSWORD) env vars.
+
+"""
+import io
+import os
+import re
+import time
+import base64
+import random
+import hashlib
+import tarfile
+import zipfile
+import threading
+import contextlib
+import collections
+import http.client
+import configparser
+import email.parser
+import urllib.parse
+
+from stratus import trace
+
+UploadResult = collections.namedtuple('UploadResult', 'filename status attempts duration error')
+
+UPLOADED = 'uploaded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+ARTIFACT_SUFFIXES = ('.whl', '.tar.gz', '.zip')
+
+PYPIRC = os.path.join(os.path.expanduser('~'), '.pypirc')
+DEFAULT_REPOSITORY = 'https://upload.pypi.org/legacy/'
+
+# upload url: simple index url for the well known indexes
+KNOWN_INDEXES = {
+    'https://upload.pypi.org/legacy/': 'https://pypi.org/simple/',
+    'https://test.pypi.org/legacy/': 'https://test.pypi.org/simple/',
+}
+
+# metadata fields that can appear more than once, mapped to the upload form field
+MULTI_FIELDS = {
+    'classifier': 'classifiers',
+    'requires-dist': 'requires_dist',
+    'provides-dist': 'provides_dist',
+    'obsoletes-dist': 'obsoletes_dist',
+    'requires-external': 'requires_external',
+    'project-url': 'project_urls',
+    'platform': 'platform',
+    'supported-platform': 'supported_platform',
+    'dynamic': 'dynamic',
+    'license-file': 'license_file',
+}
+
+HASH_RE = re.compile(r'href="[^"#]*/([^/"#]+)#sha256=([0-9a-f]{64})"', re.IGNORECASE)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PublishError(Exception):
+    pass
+
+
+class PublishReport(dict):
+    """
+    dict of filename: UploadResult for a publish
+    """
+    @property
+    def ok(self):
+        """True if every file was uploaded or already on the index"""
+        return all(r.status != FAILED for r in self.values())
+
+    @property
+    def failed(self):
+        return [r for r in self.values() if r.status == FAILED]
+
+    def summary(self):
+        """human readable report, one line per file"""
+        lines = []
+        for name in sorted(self):
+            r = self[name]
+            line = f"{name:<48} {r.status:<9} {r.duration:7.2f}s"
+            if r.attempts > 1:
+                line = f"{line} ({r.attempts} attempts)"
+            if r.error:
+                line = f"{line} {r.error}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def normalize_project(name):
+    """PEP 503 normalised project name"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def repository_config(repository, pypirc=PYPIRC):
+    """
+    resolve a repository name or url to (url, username, password)
+
+    :param repository: url, or section name in .pypirc
+    """
+    url, username, password = repository, None, None
+    if '://' not in repository:
+        parser = configparser.RawConfigParser()
+        parser.read(pypirc)
+        if parser.has_section(repository):
+            section = dict(parser.items(repository))
+            url = section.get('repository', DEFAULT_REPOSITORY)
+            username = section.get('username')
+            password = section.get('password')
+        elif repository == 'pypi':
+            url = DEFAULT_REPOSITORY
+        else:
+            raise PublishError(f"repository {repository} not found in {pypirc}")
+    username = username or os.environ.get('STRATUS_PUBLISH_USERNAME') or os.environ.get('TWINE_USERNAME')
+    password = password or os.environ.get('STRATUS_PUBLISH_PASSWORD') or os.environ.get('TWINE_PASSWORD')
+    return url, username, password
+
+
+def simple_index_url(repository_url):
+    """best guess at the simple index url for an upload url"""
+    if repository_url in KNOWN_INDEXES:
+        return KNOWN_INDEXES[repository_url]
+    return urllib.parse.urljoin(repository_url, '/simple/')
+
+
+def find_artifacts(dist_dir):
+    """sorted list of uploadable files in dist_dir"""
+    return sorted(
+        os.path.join(dist_dir, f) for f in os.listdir(dist_dir)
+        if f.endswith(ARTIFACT_SUFFIXES)
+    )
+
+
+def read_metadata(filename):
+    """
+    core metadata of a wheel (METADATA) or sdist (PKG-INFO)
+
+    :return: email.message.Message
+    """
+    raw = None
+    if filename.endswith('.whl'):
+        with zipfile.ZipFile(filename) as archive:
+            for name in archive.namelist():
+                if name.count('/') == 1 and name.endswith('.dist-info/METADATA'):
+                    raw = archive.read(name)
+                    break
+    elif filename.endswith('.tar.gz'):
+        with tarfile.open(filename) as archive:
+            for member in archive:
+                if member.name.count('/') == 1 and member.name.endswith('/PKG-INFO'):
+                    raw = archive.extractfile(member).read()
+                    break
+    elif filename.endswith('.zip'):
+        with zipfile.ZipFile(filename) as archive:
+            for name in archive.namelist():
+                if name.count('/') == 1 and name.endswith('/PKG-INFO'):
+                    raw = archive.read(name)
+                    break
+    if raw is None:
+        raise PublishError(f"no package metadata found in {filename}")
+    return email.parser.Parser().parsestr(raw.decode('utf-8'))
+
+
+def upload_fields(filename, digest):
+    """
+    form fields for the legacy upload API
+
+    :return: list of (name, value) pairs
+    """
+    metadata = read_metadata(filename)
+    fields = [
+        (':action', 'file_upload'),
+        ('protocol_version', '1'),
+        ('metadata_version', metadata.get('Metadata-Version', '2.1')),
+        ('sha256_digest', digest),
+    ]
+    if filename.endswith('.whl'):
+        fields.append(('filetype', 'bdist_wheel'))
+        fields.append(('pyversion', os.path.basename(filename).split('-')[-3]))
+    else:
+        fields.append(('filetype', 'sdist'))
+        fields.append(('pyversion', 'source'))
+    for key in set(k.lower() for k in metadata.keys()):
+        if key == 'metadata-version':
+            continue
+        values = metadata.get_all(key)
+        if key in MULTI_FIELDS:
+            fields.extend((MULTI_FIELDS[key], v) for v in values)
+        else:
+            fields.append((key.replace('-', '_'), values[0]))
+    body = metadata.get_payload()
+    if body and body.strip():
+        fields.append(('description', body))
+    return fields
+
+
+def encode_multipart(fields, filename, content):
+    """
+    multipart/form-data body for fields plus the file content
+
+    :return: (content type, body bytes)
+    """
+    boundary = f"stratus-{os.urandom(16).hex()}"
+    out = io.BytesIO()
+    for name, value in fields:
+        out.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n".encode('utf-8'))
+        out.write(str(value).encode('utf-8'))
+        out.write(b'\r\n')
+    out.write(
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"content\"; "
+        f"filename=\"{os.path.basename(filename)}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n".encode('utf-8')
+    )
+    out.write(content)
+    out.write(f"\r\n--{boundary}--\r\n".encode('utf-8'))
+    return f"multipart/form-data; boundary={boundary}", out.getvalue()
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of keep-alive connections to one host
+
+    :param url: any url on the host
+    :param size: max idle connections kept
+    :param timeout: socket timeout in seconds
+    """
+    def __init__(self, url, size=4, timeout=60):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _new(self):
+        self.created += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        borrow a connection, it is returned to the pool unless the
+        block raises (in which case its state is unknown and it is closed)
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._new()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        make a request on a pooled connection
+
+        :return: (status, headers, body bytes)
+        """
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        with self.connection() as conn:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+            return response.status, response.headers, data
+
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+
+
+class Publisher(object):
+    """
+    Upload artifacts to a package index
+
+    :param repository_url: legacy upload API url
+    :param username: upload username
+    :param password: upload password or token
+    :param index_url: simple index url used to check for existing files,
+       defaults to a guess based on repository_url
+    :param concurrency: max uploads in flight
+    :param retries: max retries per file after the first attempt
+    :param backoff: base seconds for the exponential retry backoff
+    :param timeout: socket timeout in seconds
+    """
+    def __init__(self, repository_url, username=None, password=None, index_url=None,
+                 concurrency=4, retries=4, backoff=0.5, timeout=60):
+        self.repository_url = repository_url
+        self.index_url = index_url or simple_index_url(repository_url)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = {'User-Agent': 'stratus-publish'}
+        if username or password:
+            token = base64.b64encode(f"{username or ''}:{password or ''}".encode('utf-8')).decode('ascii')
+            self.headers['Authorization'] = f"Basic {token}"
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._hashes = {}
+        self._hashes_lock = threading.Lock()
+
+    def pool(self, url):
+        """ConnectionPool for the host of url"""
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.netloc)
+        with self._pools_lock:
+            if key not in self._pools:
+                self._pools[key] = ConnectionPool(url, size=self.concurrency, timeout=self.timeout)
+            return self._pools[key]
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+    def _sleep(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        time.sleep(delay)
+
+    def _request(self, method, url, body=None, headers=None, follow=3):
+        """request with retries, returns (status, body) of the final attempt and the attempt count"""
+        headers = dict(self.headers, **(headers or {}))
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                status, response_headers, data = self.pool(url).request(method, url, body, headers)
+            except (OSError, http.client.HTTPException) as ex:
+                if attempt > self.retries:
+                    raise PublishError(f"{method} {url} failed: {ex}") from ex
+                self._sleep(attempt - 1)
+                continue
+            if status in (301, 302, 303, 307, 308) and method == 'GET' and follow:
+                url = urllib.parse.urljoin(url, response_headers.get('Location', ''))
+                follow -= 1
+                attempt -= 1
+                continue
+            if status in RETRY_STATUSES and attempt <= self.retries:
+                self._sleep(attempt - 1, response_headers.get('Retry-After'))
+                continue
+            return status, data, attempt
+
+    def existing_hashes(self, project, refresh=False):
+        """
+        sha256 digests of the files for project on the index, fetched
+        once per project
+
+        :param refresh: fetch again even if already fetched
+        :return: dict of filename: sha256
+        """
+        project = normalize_project(project)
+        with self._hashes_lock:
+            if project in self._hashes and not refresh:
+                return self._hashes[project]
+        url = urllib.parse.urljoin(self.index_url.rstrip('/') + '/', f"{project}/")
+        status, data, _ = self._request('GET', url, headers={'Accept': 'text/html'})
+        hashes = {}
+        if status == 200:
+            for name, digest in HASH_RE.findall(data.decode('utf-8', 'replace')):
+                hashes[urllib.parse.unquote(name)] = digest.lower()
+        elif status != 404:
+            raise PublishError(f"checking {url} failed with HTTP {status}")
+        with self._hashes_lock:
+            self._hashes[project] = hashes
+        return hashes
+
+    def upload(self, filename):
+        """
+        upload one file unless the index already has it
+
+        :return: UploadResult
+        """
+        start = time.perf_counter()
+        basename = os.path.basename(filename)
+        try:
+            with open(filename, 'rb') as handle:
+                content = handle.read()
+            digest = hashlib.sha256(content).hexdigest()
+            fields = upload_fields(filename, digest)
+            project = dict(fields)['name']
+            existing = self.existing_hashes(project).get(basename)
+            if existing == digest:
+                return UploadResult(basename, SKIPPED, 0, time.perf_counter() - start, None)
+            if existing is not None:
+                return UploadResult(
+                    basename, FAILED, 0, time.perf_counter() - start,
+                    'a different file with this name is already on the index'
+                )
+            content_type, body = encode_multipart(fields, filename, content)
+            with trace.span('upload', cat='publish', file=basename, bytes=len(body)):
+                status, data, attempts = self._request(
+                    'POST', self.repository_url, body, {'Content-Type': content_type}
+                )
+        except (OSError, PublishError) as ex:
+            return UploadResult(basename, FAILED, 0, time.perf_counter() - start, str(ex))
+        duration = time.perf_counter() - start
+        if 200 <= status < 300:
+            return UploadResult(basename, UPLOADED, attempts, duration, None)
+        message = data.decode('utf-8', 'replace').strip()
+        if status == 409 or 'already exist' in message.lower():
+            # uploaded since the hashes were fetched, only the same file counts as done
+            try:
+                existing = self.existing_hashes(project, refresh=True).get(basename)
+            except PublishError:
+                existing = None
+            if existing == digest:
+                return UploadResult(basename, SKIPPED, attempts, time.perf_counter() - start, None)
+        return UploadResult(
+            basename, FAILED, attempts, duration, f"HTTP {status}: {message.splitlines()[0] if message else ''}"
+        )
+
+    def publish(self, filenames):
+        """
+        upload files concurrently
+
+        :param filenames: artifact paths
+        :return: PublishReport
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        report = PublishReport()
+        if not filenames:
+            return report
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(filenames))) as pool:
+            for result in pool.map(self.upload, filenames):
+                report[result.filename] = result
+        return report
@@ -1,10 +1,56 @@
 #!/usr/bin/env python3
 
 import os
+import stat
+import posixpath
+import time
+import functools
+import signal
 import contextlib
+import threading
+import subprocess
+import collections
 
-from git import Repo
-from stratus.shell_commands import command_output
+from stratus import trace
+from stratus.trace import traced
+from stratus.lazy import lazy_import
+from stratus.shell_commands import command_output, command_records
+from stratus.refs import RefSnapshot, RefMap, HEADS, TAGS
+from stratus.git_session import git_session, ZERO_SHA
+from stratus.tag_index import TagIndex
+
+# GitPython is only imported once a PackageRepo is actually created
+gitpython = lazy_import('git')
+
+
+def trace_gitpython():
+    """
+    wrap GitPythons command execution so that every git call
+    it makes is recorded by the tracer
+    """
+    git_cmd = gitpython.cmd.Git
+    if getattr(git_cmd.execute, 'stratus_traced', False):
+        return
+    execute = git_cmd.execute
+
+    @functools.wraps(execute)
+    def traced_execute(self, command, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = execute(self, command, *args, **kwargs)
+        except gitpython.exc.GitCommandError as ex:
+            trace.record_process(command, start, ex.status, len(ex.stdout or ''))
+            raise
+        if isinstance(result, tuple):
+            trace.record_process(command, start, result[0], len(result[1] or ''))
+        elif isinstance(result, (str, bytes)):
+            trace.record_process(command, start, 0, len(result))
+        else:
+            # as_process, the caller waits on it
+            trace.record_process(command, start, None, 0)
+        return result
+    traced_execute.stratus_traced = True
+    git_cmd.execute = traced_execute
 
 
 def repo_directory():
@@ -17,6 +63,54 @@ def repo_directory():
     return command_output(['git', 'rev-parse', '--show-toplevel'], split=False)
 
 
+LogRecord = collections.namedtuple('LogRecord', 'sha date author subject')
+
+# git log fields are split on the ascii unit separator, records on NUL
+LOG_FIELD_SEP = '\x1f'
+LOG_FORMAT = LOG_FIELD_SEP.join(('%H', '%ci', '%an', '%s'))
+
+FetchResult = collections.namedtuple('FetchResult', 'remote ok duration timed_out error')
+
+
+def mutates_refs(func):
+    """
+    serialise a PackageRepo method that moves refs or HEAD on the repos
+    ref_lock, so a repo shared by several threads (eg batch releases)
+    only runs one ref mutation at a time
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.ref_lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class FetchReport(dict):
+    """
+    dict of remote name: FetchResult for a multi remote fetch
+    """
+    @property
+    def ok(self):
+        """True if every remote fetched successfully"""
+        return all(r.ok for r in self.values())
+
+    @property
+    def failed(self):
+        """list of FetchResults that failed or timed out"""
+        return [r for r in self.values() if not r.ok]
+
+    def summary(self):
+        """human readable report, one line per remote"""
+        lines = []
+        for name in sorted(self):
+            r = self[name]
+            status = 'ok' if r.ok else ('timeout' if r.timed_out else 'failed')
+            line = f"{name:<20} {status:<8} {r.duration:7.2f}s"
+            if r.error:
+                line = f"{line} {r.error.splitlines()[0]}"
+            lines.append(line)
+        return '\n'.join(lines)
+
 
 class Committer(object):
     """
@@ -51,20 +145,121 @@ class Committer(object):
             diffs.append(diff.a_blob.path)
         return diffs
 
+    def _git(self, args, stdin, env=None):
+        """run a git plumbing command in the work tree feeding it stdin"""
+        process = subprocess.Popen(
+            ['git'] + args,
+            cwd=self._repo.working_tree_dir,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        start = time.perf_counter()
+        outp, err = process.communicate(stdin)
+        trace.record_process(['git'] + args, start, process.returncode, len(outp))
+        if process.returncode:
+            raise RuntimeError(err.decode('utf-8', 'replace').strip())
+        return outp.decode('utf-8')
+
+    def index_entries(self):
+        """
+        build index-info entries for the added files: regular files are
+        hashed into the object db with a single hash-object --stdin-paths,
+        executable bits are taken from the file mode and deleted files
+        become removals. Directories are expanded to the tracked and
+        untracked, not ignored, files under them as git add <dir> would.
+
+        :return: list of (mode, sha, path) tuples
+        """
+        worktree = self._repo.working_tree_dir
+        paths = set()
+        dirs = []
+        for f in self._files:
+            path = os.path.relpath(os.path.abspath(f), worktree).replace(os.sep, '/')
+            full = os.path.join(worktree, path)
+            if os.path.isdir(full) and not os.path.islink(full):
+                dirs.append(path)
+            else:
+                paths.add(path)
+        if dirs:
+            listed = self._git(['ls-files', '-z', '-c', '-o', '--exclude-standard', '--'] + dirs, b'')
+            paths.update(p for p in listed.split('\0') if p)
+        regular = []
+        entries = []
+        for path in sorted(paths):
+            try:
+                st = os.lstat(os.path.join(worktree, path))
+            except FileNotFoundError:
+                entries.append(('0', ZERO_SHA, path))
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                target = os.readlink(os.path.join(worktree, path))
+                sha = self._git(['hash-object', '-w', '--stdin'], target.encode('utf-8')).strip()
+                entries.append(('120000', sha, path))
+                continue
+            mode = '100755' if st.st_mode & stat.S_IXUSR else '100644'
+            regular.append((mode, path))
+        if regular:
+            stdin = ''.join(f"{path}\n" for _, path in regular).encode('utf-8')
+            shas = self._git(['hash-object', '-w', '--stdin-paths'], stdin).split()
+            entries.extend((mode, sha, path) for (mode, path), sha in zip(regular, shas))
+        return entries
+
     def commit(self, msg):
         """
-        commit changes to repo, also preserves executable bits if set
+        commit changes to repo, also preserves executable bits if set.
+        All added files go into the index in one update-index --index-info
+        write rather than a process per file.
 
         :param msg: commit message
         :return:
         """
-        self._repo.index.add(list(self._files))
-        for f in self._files:
-            if os.access(f, os.X_OK):
-                repo.git.update_index(f, chmod='+x')
+        entries = self.index_entries()
+        if entries:
+            stdin = b''.join(
+                f"{mode} {sha}\t{path}\0".encode('utf-8')
+                for mode, sha, path in entries
+            )
+            self._git(['update-index', '-z', '--index-info'], stdin)
         # commits with message
         self._repo.index.commit(msg)
 
+    def commit_to_branch(self, msg):
+        """
+        commit the added files onto the branch without checking it out:
+        the branch tree is read into a throwaway index, the entries are
+        applied and written with write-tree/commit-tree, then the branch
+        ref is moved. File contents are taken from the current work tree.
+
+        :param msg: commit message
+        :return: sha of the new commit
+        """
+        import tempfile
+        ref = f"refs/heads/{self._branch}"
+        parent = self._git(['rev-parse', '--verify', f"{ref}^{{commit}}"], b'').strip()
+        entries = self.index_entries()
+        fd, index = tempfile.mkstemp(prefix='stratus-index-')
+        os.close(fd)
+        # git wants a missing index file rather than an empty one
+        os.unlink(index)
+        env = dict(os.environ, GIT_INDEX_FILE=index)
+        try:
+            self._git(['read-tree', parent], b'', env)
+            if entries:
+                stdin = b''.join(
+                    f"{mode} {sha}\t{path}\0".encode('utf-8')
+                    for mode, sha, path in entries
+                )
+                self._git(['update-index', '-z', '--index-info'], stdin, env)
+            tree = self._git(['write-tree'], b'', env).strip()
+        finally:
+            if os.path.exists(index):
+                os.unlink(index)
+        sha = self._git(['commit-tree', tree, '-p', parent, '-m', msg], b'').strip()
+        self._git(['update-ref', '-m', f"commit: {msg}", ref, sha, parent], b'')
+        return sha
+
 
 
 class PackageRepo(object):
@@ -78,24 +273,49 @@ class PackageRepo(object):
         if self.dir is None:
             msg = "Unable to determine repo dir"
             raise RuntimeError(msg)
-        self.git = Repo(self.dir)
+        if trace.tracer() is not None:
+            trace_gitpython()
+        self.git = gitpython.Repo(self.dir)
         self.gitconfig = None
-
+        self.refs = RefSnapshot(getattr(self.git, 'common_dir', self.git.git_dir))
+        self.session = git_session(self.dir)
+        self._remotes = None
+        self._remotes_stamp = None
+        self._remote_urls = {}
+        self._tag_indexes = {}
+        self.ref_lock = threading.RLock()
+        self._index_lock = threading.Lock()
 
     @property
     def remotes(self):
-        """dict of remote name: remote instance"""
-        return {r.name:r for r in self.git.remotes}
+        """dict of remote name: remote instance, cached until the git config changes"""
+        config = os.path.join(self.refs.git_dir, 'config')
+        stamp = os.stat(config).st_mtime_ns if os.path.exists(config) else None
+        if self._remotes is None or stamp != self._remotes_stamp:
+            self._remotes = {r.name:r for r in self.git.remotes}
+            self._remotes_stamp = stamp
+            self._remote_urls = {}
+        return self._remotes
 
     @property
     def heads(self):
-        """dict of head name: head instance"""
-        return {h.name:h for h in self.git.heads}
+        """mapping of head name: head instance"""
+        return RefMap(self.refs, HEADS, lambda ref: gitpython.Head(self.git, ref))
 
     @property
     def tags(self):
-        """dict of tag name: tag reference object """
-        return {ref.name: ref for ref in self.git.tags}
+        """mapping of tag name: tag reference object """
+        return RefMap(self.refs, TAGS, lambda ref: gitpython.TagReference(self.git, ref))
+
+    def _branch_moved(self, branch_name=None):
+        """
+        write-through update of the ref snapshot after a
+        branch has been created or committed to
+        """
+        branch_name = branch_name or self.active_branch_name
+        if branch_name is None:
+            return
+        self.refs.update(f"{HEADS}{branch_name}", self.rev_parse('HEAD'))
 
     @property
     def branches(self):
@@ -104,7 +324,7 @@ class PackageRepo(object):
 
     def head_of(self, branch_name):
         """get reference to current head of named branch"""
-        return getattr(self.git.heads, branch_name)
+        return self.heads[branch_name]
 
     @property
     def current_head(self):
@@ -113,8 +333,70 @@ class PackageRepo(object):
 
     @property
     def head_commit(self):
-        """get commit of current head"""
-        return self.git.head.commit
+        """
+        get commit of current head, HEAD is resolved via the git session,
+        the commit details are loaded by GitPython when accessed
+        """
+        sha = self.rev_parse('HEAD')
+        if sha is None:
+            # unborn branch, let GitPython raise as it always has
+            return self.git.head.commit
+        return gitpython.Commit(self.git, bytes.fromhex(sha))
+
+    def tag_index(self, prefix=''):
+        """
+        TagIndex of the semver tags in this repo, updated from
+        the tags that changed since it was last used
+
+        :param prefix: tag prefix to strip before parsing versions
+        """
+        with self._index_lock:
+            if prefix not in self._tag_indexes:
+                self._tag_indexes[prefix] = TagIndex(self.refs.git_dir, prefix=prefix)
+            index = self._tag_indexes[prefix]
+            index.update(self.refs.tags())
+            return index
+
+    def latest_version(self, prefix=''):
+        """highest released Version tagged in the repo, None if there isnt one"""
+        latest = self.tag_index(prefix).latest()
+        return latest[0] if latest else None
+
+    def rev_parse(self, rev):
+        """sha of a revision via the git session, None if it doesnt exist"""
+        return self.session.rev_parse(rev)
+
+    def commit_sha(self, rev):
+        """sha of the commit a revision points to, peeling tags"""
+        return self.session.rev_parse(f"{rev}^{{commit}}")
+
+    def tag_commit(self, tag):
+        """sha of the commit a tag points to, None if no such tag"""
+        if tag not in self.tags:
+            return None
+        return self.commit_sha(f"{TAGS}{tag}")
+
+    def read_commit(self, rev):
+        """CommitInfo for a revision via the git session"""
+        return self.session.read_commit(rev)
+
+    @mutates_refs
+    def update_refs(self, updates=None, deletes=None, message=None):
+        """
+        create, move or delete several refs in one update-ref transaction
+        and patch the ref snapshot to match
+
+        :param updates: iterable of (ref, new_sha) or (ref, new_sha, old_sha)
+        :param deletes: iterable of ref names to delete
+        :param message: reflog message
+        """
+        updates = list(updates or [])
+        deletes = list(deletes or [])
+        self.session.update_refs(updates, deletes, message=message)
+        for u in updates:
+            self.refs.update(u[0], u[1])
+        for d in deletes:
+            self.refs.delete(d if isinstance(d, str) else d[0])
 
     def remote(self, remote_name):
         """get a remote instance for the given name"""
@@ -123,6 +405,8 @@ class PackageRepo(object):
     def remote_exists(self, remote_name):
         return self.remote(remote_name) is not None
 
+    @traced()
+    @mutates_refs
     def fetch(self, remote=None):
         """
         fetch remote, if remote not specified, fetch all
@@ -133,8 +417,73 @@ class PackageRepo(object):
         if remote:
             self.remote(remote).fetch()
         else:
-            for rem in self.git.remotes:
-                rem.fetch()
+            report = self.fetch_remotes()
+            if not report.ok:
+                raise RuntimeError(f"fetch failed:\n{report.summary()}")
+        self.refs.invalidate()
+
+    def _fetch_one(self, remote_name, timeout=None):
+        """
+        fetch a single remote in a git subprocess that is killed
+        if it exceeds timeout seconds
+        """
+        start = time.monotonic()
+        trace_start = time.perf_counter()
+        # own process group so ssh/upload-pack children get killed too
+        process = subprocess.Popen(
+            ['git', 'fetch', remote_name],
+            cwd=self.dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
+            start_new_session=(os.name == 'posix')
+        )
+        try:
+            _, err = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            process.communicate()
+            trace.record_process(process.args, trace_start, None, 0)
+            return FetchResult(
+                remote_name, False, time.monotonic() - start, True,
+                f"timed out after {timeout}s"
+            )
+        trace.record_process(process.args, trace_start, process.returncode, len(err))
+        error = None
+        if process.returncode:
+            error = err.decode('utf-8', 'replace').strip()
+        return FetchResult(
+            remote_name, process.returncode == 0, time.monotonic() - start, False, error
+        )
+
+    @traced()
+    @mutates_refs
+    def fetch_remotes(self, remotes=None, concurrency=4, timeout=None):
+        """
+        fetch several remotes concurrently with a bounded thread pool,
+        a slow or failing remote doesnt hold up the others
+
+        :param remotes: list of remote names, defaults to all remotes
+        :param concurrency: max number of fetches running at once
+        :param timeout: per remote timeout in seconds, None for no timeout
+        :return: FetchReport of remote name: FetchResult
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if remotes is None:
+            remotes = list(self.remotes.keys())
+        report = FetchReport()
+        if remotes:
+            workers = max(1, min(concurrency, len(remotes)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(self._fetch_one, r, timeout) for r in remotes]
+                for f in futures:
+                    result = f.result()
+                    report[result.remote] = result
+        self.refs.invalidate()
+        return report
 
     def tag_ref(self, tag):
         """get reference object for given tag"""
@@ -142,12 +491,14 @@ class PackageRepo(object):
 
     def remote_url(self, remote_name):
         """
-        get the first url for the given remote
+        get the first url for the given remote, cached until the
+        git config changes
 
         """
         rem = self.remote(remote_name)
-        urls = list(rem.urls)
-        return urls[0]
+        if remote_name not in self._remote_urls:
+            self._remote_urls[remote_name] = list(rem.urls)[0]
+        return self._remote_urls[remote_name]
 
     @property
     def active_branch(self):
@@ -157,6 +508,8 @@ class PackageRepo(object):
         return self.git.active_branch
 
     @active_branch.setter
+    @traced('PackageRepo.checkout')
+    @mutates_refs
     def active_branch(self, branch_name):
         """setting the active_branch property checks out that branch"""
         if self.active_branch_name == branch_name:
@@ -167,6 +520,7 @@ class PackageRepo(object):
             branch_ref.checkout()
         else:
             self.git.git.checkout(b=branch_name)
+            self._branch_moved(branch_name)
 
     @property
     def active_branch_name(self):
@@ -175,6 +529,67 @@ class PackageRepo(object):
             return None
         return str(self.active_branch)
 
+    def _run_git(self, args, env=None):
+        """
+        run a git command in the repo, raising RuntimeError if it fails.
+        stdin is empty, commands like mktree must not read the callers stdin
+        """
+        command = ['git'] + args
+        start = time.perf_counter()
+        process = subprocess.run(
+            command, cwd=self.dir, env=env,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        trace.record_process(command, start, process.returncode, len(process.stdout))
+        if process.returncode:
+            raise RuntimeError(process.stderr.decode('utf-8', 'replace').strip())
+        return process.stdout.decode('utf-8')
+
+    @traced()
+    def tree_hash(self, path=None, exclude=()):
+        """
+        git tree sha of a directory as it is in the work tree, including
+        uncommitted and untracked (but not ignored) files.
+        If the directory is clean this is just rev-parse HEAD:<subdir>,
+        otherwise the changes are staged into a throwaway copy of the
+        index and hashed with write-tree, the real index isnt touched.
+
+        :param path: directory in the repo, defaults to the repo root
+        :param exclude: paths relative to path to leave out, eg dist
+        :return: tree sha
+        """
+        subdir = os.path.relpath(os.path.abspath(path or self.dir), os.path.abspath(self.dir))
+        subdir = '' if subdir == '.' else subdir.replace(os.sep, '/')
+        pathspec = [subdir or '.']
+        pathspec.extend(f":(exclude){posixpath.join(subdir, e)}" for e in exclude)
+        # no optional locks so concurrent callers dont fight over index.lock
+        status = self._run_git(['--no-optional-locks', 'status', '--porcelain', '--'] + pathspec)
+        if not status.strip():
+            tree = self.rev_parse(f"HEAD:{subdir}")
+            if tree is not None:
+                return tree
+
+        import shutil
+        import tempfile
+        fd, index = tempfile.mkstemp(prefix='stratus-index-')
+        os.close(fd)
+        try:
+            current_index = os.path.join(self.git.git_dir, 'index')
+            if os.path.exists(current_index):
+                shutil.copy2(current_index, index)
+            else:
+                # git wants a missing index file rather than an empty one
+                os.unlink(index)
+            env = dict(os.environ, GIT_INDEX_FILE=index)
+            self._run_git(['add', '--all', '--'] + pathspec, env=env)
+            args = ['write-tree']
+            if subdir:
+                args.append(f"--prefix={subdir}/")
+            return self._run_git(args, env=env).strip()
+        finally:
+            if os.path.exists(index):
+                os.unlink(index)
+
     @property
     def is_detached_head(self):
         """helper to check for detached head conditions"""
@@ -193,6 +608,25 @@ class PackageRepo(object):
             return True
         return False
 
+    def remote_branch_index(self, remote_name, authoritative=False):
+        """
+        set of branch names on the named remote.
+
+        Read from the remote tracking refs in the ref snapshot, which
+        reloads when the refs change on disk (including an external
+        git fetch), or from a single ls-remote call against the remote
+        itself if authoritative is True
+
+        :param remote_name: remote name
+        :param authoritative: query the remote rather than local tracking refs
+        :return: set of branch names, without the remote prefix
+        """
+        if not authoritative:
+            return set(self.refs.remote_refs(remote_name)) - {'HEAD'}
+        output = self.git.git.ls_remote(remote_name, heads=True)
+        refs = [line.split('\t', 1)[-1] for line in output.splitlines()]
+        return {r[len(HEADS):] for r in refs if r.startswith(HEADS)}
+
     def remote_branches(self, remote_name):
         """
         remote_branches
@@ -200,25 +634,43 @@ class PackageRepo(object):
         list remote branches for named remote
 
         :param remote_name:
-        :return: list of branch names
+        :return: list of branch names as remote/branch
         """
-        br = self.git.git.branch(r=True)
-        result = [x.strip() for x in br.split() if br.split()]
-        return result
+        return sorted(f"{remote_name}/{b}" for b in self.remote_branch_index(remote_name))
 
-    def remote_branch_exists(self, remote, branch):
+    def remote_branch_exists(self, remote, branch, authoritative=False):
         """
         check named branch exists on specified remote
 
         :param remote: remote name
         :param branch: branch name
+        :param authoritative: check the remote itself rather than tracking refs
         :return: True if branch exists on remote
         """
-        match = branch
-        if not match.startswith(f"{remote}/"):
-            match = f"{remote}/{branch}"
-        return match in self.remote_branches(remote)
+        if branch.startswith(f"{remote}/"):
+            branch = branch[len(remote) + 1:]
+        if authoritative:
+            return branch in self.remote_branch_index(remote, authoritative=True)
+        return branch != 'HEAD' and branch in self.refs.remote_refs(remote)
 
+    def remote_branches_exist(self, remote, branches, authoritative=False):
+        """
+        batch version of remote_branch_exists
+
+        :param remote: remote name
+        :param branches: iterable of branch names
+        :param authoritative: check the remote itself rather than tracking refs
+        :return: dict of branch name: True if branch exists on remote
+        """
+        index = self.remote_branch_index(remote, authoritative)
+        prefix = f"{remote}/"
+        return {
+            b: (b[len(prefix):] if b.startswith(prefix) else b) in index
+            for b in branches
+        }
+
+    @traced()
+    @mutates_refs
     def push(self, remote):
         """
         _push_
@@ -230,12 +682,16 @@ class PackageRepo(object):
             # no remote exists
             return None
         ret = rem.push(self.git.head)
+        # remote tracking refs may have moved
+        self.refs.invalidate()
         # Check to make sure that we haven't errored out.
         for r in ret:
             if r.flags >= r.ERROR:
                 raise RuntimeError(r.summary)
         return ret
 
+    @traced()
+    @mutates_refs
     def pull(self, remote):
         """
         pull current branch from remote
@@ -245,12 +701,16 @@ class PackageRepo(object):
         """
         rem = self.remote(remote)
         rem.pull()
+        self.refs.invalidate()
 
+    @traced()
+    @mutates_refs
     def tag_release(self, tag, master_branch, remote=None, force=False):
         """
         _tag_release_
 
-        Checkout master branch, tag it and push tags
+        Tag the tip of the master branch and push the branch and tag.
+        The tag ref is written directly, master doesnt get checked out.
 
         """
         if tag in self.tags:
@@ -260,11 +720,20 @@ class PackageRepo(object):
             ).format(tag, master_branch)
             raise RuntimeError(msg)
 
-        with self.on_branch(master_branch):
-            self.git.create_tag(tag, force=force)
-            if remote:
-                self.push(remote)
+        sha = self.commit_sha(f"{HEADS}{master_branch}")
+        if sha is None:
+            raise RuntimeError(f"Cannot tag {tag}, branch {master_branch} does not exist")
+        old = None if force else ZERO_SHA
+        update = (f"{TAGS}{tag}", sha) if old is None else (f"{TAGS}{tag}", sha, old)
+        self.update_refs([update], message=f"tag {tag}")
+        if remote:
+            self.push_refs(remote, [
+                f"{HEADS}{master_branch}:{HEADS}{master_branch}",
+                f"{TAGS}{tag}:{TAGS}{tag}",
+            ])
 
+    @traced()
+    @mutates_refs
     def checkout_remote_branch(self, branch, remote, track=True, remote_branch=None):
         """
         checkout specified branch, updating to pull in latest remotes'
@@ -290,9 +759,12 @@ class PackageRepo(object):
                 remote_br,
                 b=branch
             )
+        self._branch_moved(branch)
         self.active_branch = branch
         return
 
+    @traced()
+    @mutates_refs
     def update_to_tag(self, tag, remote, onto_branch=True, onto_branch_name=None):
         """
         checkout specified tag, pulling remote tags first
@@ -305,6 +777,7 @@ class PackageRepo(object):
         """
         rem = self.remote(remote)
         rem.fetch(tags=True)
+        self.refs.invalidate()
 
         ref = self.tag_ref(tag)
         print(f"ref={ref}")
@@ -312,6 +785,7 @@ class PackageRepo(object):
             branch_name = onto_branch_name or f"tag/{tag}"
             if branch_name not in self.branches:
                 self.git.git.checkout(ref, b=branch_name)
+                self._branch_moved(branch_name)
             else:
                 self.active_branch = branch_name
         else:
@@ -319,28 +793,190 @@ class PackageRepo(object):
             self.git.git.checkout(ref)
         return
 
+    def iter_log(self, revision_range, skip=0, limit=None):
+        """
+        stream commits in a revision range from git log as LogRecords,
+        parsed as git produces them so memory use doesnt grow with the
+        size of the range
+
+        :param revision_range: git revision range, eg v1.0.0..v1.1.0
+        :param skip: number of commits to skip, for paging
+        :param limit: max number of commits to return, None for all
+        :return: generator of LogRecord(sha, date, author, subject)
+        """
+        command = ['git', 'log', '-z', f"--format={LOG_FORMAT}"]
+        if skip:
+            command.append(f"--skip={skip}")
+        if limit is not None:
+            command.append(f"--max-count={limit}")
+        command.extend([revision_range, '--'])
+        for record in command_records(command, cwd=self.dir):
+            if record:
+                yield LogRecord(*record.split(LOG_FIELD_SEP, 3))
+
+    def iter_release_notes(self, start_tag, end_tag, skip=0, limit=None):
+        """
+        stream the commits after start_tag up to and including end_tag
+
+        :param start_tag: previous tag
+        :param end_tag:  current tag
+        :param skip: number of commits to skip, for paging
+        :param limit: max number of commits to return, None for all
+        :return: generator of LogRecord(sha, date, author, subject)
+        """
+        revision_range = f"{TAGS}{start_tag}..{TAGS}{end_tag}"
+        return self.iter_log(revision_range, skip=skip, limit=limit)
+
     def release_notes(self, start_tag, end_tag):
         """
         generate release notes from commit messages between the two
         tags given.
-        For each commit a dict entry is created containing date, author, message fields
+        For each commit a dict entry is created containing date, author, message fields.
+        Use iter_release_notes to stream large ranges.
 
         :param start_tag: previous tag
         :param end_tag:  current tag
         :return: list of dicts
         """
-        start_ref = self.tag_ref(start_tag).commit
-        end_ref = self.tag_ref(end_tag).commit
-        result = self.git.git.log(start_ref, end_ref, pretty="format:%ci --- %an --- %s")
-        lines = result.split('\n')
-        messages = []
-        for line in lines:
-            elems = line.split('---', 2)
-            date = elems[0].strip()
-            author = elems[1].strip()
-            message = elems[2].strip()
-            messages.append({'date': date, 'author': author, 'message': message})
-        return messages
+        return [
+            {'date': r.date, 'author': r.author, 'message': r.subject}
+            for r in self.iter_release_notes(start_tag, end_tag)
+        ]
+
+    @traced()
+    @mutates_refs
+    def push_refs(self, remote, refspecs):
+        """
+        push refspecs to a remote, eg refs/heads/master:refs/heads/master,
+        without needing any of them checked out
+
+        :param remote: remote name
+        :param refspecs: list of refspecs
+        """
+        rem = self.remote(remote)
+        if rem is None:
+            return None
+        ret = rem.push(refspecs)
+        self.refs.invalidate()
+        for r in ret:
+            if r.flags & r.ERROR:
+                raise RuntimeError(r.summary)
+        return ret
+
+    def is_ancestor(self, ancestor, rev):
+        """True if ancestor is reachable from rev"""
+        # exits 1 when it isnt an ancestor, so _run_git would raise
+        start = time.perf_counter()
+        command = ['git', 'merge-base', '--is-ancestor', ancestor, rev]
+        process = subprocess.run(
+            command, cwd=self.dir,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        trace.record_process(command, start, process.returncode, 0)
+        return process.returncode == 0
+
+    def commit_tree(self, tree, parents, message):
+        """create a commit object for tree, returns its sha"""
+        args = ['commit-tree', tree]
+        for parent in parents:
+            args.extend(['-p', parent])
+        args.extend(['-m', message])
+        return self._run_git(args).strip()
+
+    def merge_tree(self, ours, theirs):
+        """
+        three way merge of two commits into a tree, with no index or
+        work tree involved (git merge-tree --write-tree, git >= 2.38)
+
+        :return: tree sha, None if there are conflicts or git is too old
+        """
+        start = time.perf_counter()
+        command = ['git', 'merge-tree', '--write-tree', '--no-messages', ours, theirs]
+        process = subprocess.run(command, cwd=self.dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        trace.record_process(command, start, process.returncode, len(process.stdout))
+        if process.returncode:
+            return None
+        return process.stdout.decode('utf-8').split('\n', 1)[0].strip()
+
+    @mutates_refs
+    def create_branch(self, branch, start_point='HEAD', message=None):
+        """
+        create a branch with update-ref, nothing is checked out
+
+        :param branch: new branch name
+        :param start_point: revision the branch starts at
+        :param message: if given, the branch gets an empty commit with this message on top of start_point
+        :return: sha of the branch tip
+        """
+        base = self.commit_sha(start_point)
+        if message is not None:
+            if base is None:
+                # unborn HEAD, start from the empty tree
+                tree = self._run_git(['mktree']).strip()
+                sha = self.commit_tree(tree, [], message)
+            else:
+                sha = self.commit_tree(self.read_commit(base).tree, [base], message)
+        elif base is None:
+            raise RuntimeError(f"Cannot create branch {branch}, {start_point} is not a commit")
+        else:
+            sha = base
+        self.update_refs([(f"{HEADS}{branch}", sha, ZERO_SHA)], message=f"branch: Created from {start_point}")
+        return sha
+
+    def fast_forward(self, branch, rev):
+        """
+        move branch to rev if that is a fast forward, without checkout.
+        A branch that doesnt exist locally yet is created at rev, eg a
+        branch that so far only exists on the remote.
+
+        :return: True if branch now contains rev, False if they diverged
+           or neither branch nor rev exist
+        """
+        ref = f"{HEADS}{branch}"
+        current = self.commit_sha(ref)
+        target = self.commit_sha(rev)
+        if current is None:
+            if target is None:
+                return False
+            self.update_refs([(ref, target, ZERO_SHA)], message=f"branch: Created from {rev}")
+            return True
+        if target is None or current == target or self.is_ancestor(target, current):
+            return True
+        if not self.is_ancestor(current, target):
+            return False
+        self.update_refs([(ref, target, current)], message=f"fast-forward to {rev}")
+        return True
+
+    @mutates_refs
+    def merge_refs(self, source, target_branch, fastforward=True, message=None):
+        """
+        merge source into target_branch using merge-tree/commit-tree,
+        the target branch ref is moved without it being checked out
+
+        :param source: branch name or revision to merge
+        :param target_branch: name of the local branch to merge into
+        :param fastforward: allow fast forwards, False always makes a merge commit
+        :return: new sha of the target branch, None if the merge has
+           conflicts and needs a work tree
+        """
+        ref = f"{HEADS}{target_branch}"
+        ours = self.commit_sha(ref)
+        theirs = self.commit_sha(source)
+        if ours is None or theirs is None:
+            return None
+        if self.is_ancestor(theirs, ours):
+            # already merged
+            return ours
+        if fastforward and self.is_ancestor(ours, theirs):
+            new = theirs
+        else:
+            tree = self.merge_tree(ours, theirs)
+            if tree is None:
+                return None
+            message = message or f"Merge branch '{source}' into {target_branch}"
+            new = self.commit_tree(tree, [ours, theirs], message)
+        self.update_refs([(ref, new, ours)], message=f"merge {source}")
+        return new
 
     @contextlib.contextmanager
     def on_branch(self, branch_name, remote=None, push=False, pull=False):
@@ -352,25 +988,42 @@ class PackageRepo(object):
         :param remote: name of remote to sync branch with
         :return:
         """
-        prev_branch = self.active_branch_name
-        self.active_branch = branch_name
-        if remote and pull:
-            self.pull(remote)
-        yield self.active_branch
-        if remote and push:
-            self.push(remote)
-        # revert to prev
-        self.active_branch = prev_branch
+        # the work tree is shared, hold the ref lock until switched back
+        with self.ref_lock:
+            prev_branch = self.active_branch_name
+            self.active_branch = branch_name
+            if remote and pull:
+                self.pull(remote)
+            yield self.active_branch
+            if remote and push:
+                self.push(remote)
+            # revert to prev
+            self.active_branch = prev_branch
 
+    @traced()
+    @mutates_refs
     def merge(self, source_branch, target_branch, remote=None, strategy=None, strategy_option=None, fastforward=True):
         """
         _merge_
 
-        Merge source branch into destination branch
+        Merge source branch into destination branch.
+        If the target isnt the checked out branch the merge is done with
+        merge-tree/commit-tree and the target ref is moved directly, the
+        work tree is only used for custom strategies, conflicts or when
+        the remote branch has diverged from the local one.
 
         :returns: sha of the last commit from the merged branch
 
         """
+        checked_out = target_branch == self.active_branch_name
+        if not (strategy or strategy_option or checked_out):
+            synced = True
+            if remote:
+                self.fetch(remote)
+                synced = self.fast_forward(target_branch, f"refs/remotes/{remote}/{target_branch}")
+            if synced and self.merge_refs(source_branch, target_branch, fastforward) is not None:
+                return self.heads[target_branch]
+
         with self.on_branch(target_branch) as target_br:
             if remote:
                 self.pull(remote)
@@ -379,9 +1032,12 @@ class PackageRepo(object):
                 kwargs['strategy-option'] = strategy_option
             if fastforward:
                 kwargs['ff'] = True
+            else:
+                kwargs['no_ff'] = True
             if strategy:
                 kwargs['strategy'] = strategy
-            self.git.git.merge(source_branch, target_branch, **kwargs)
+            self.git.git.merge(source_branch, **kwargs)
+            self._branch_moved(target_branch)
             merge_ref = self.current_head.ref
         return merge_ref
 
@@ -399,22 +1055,35 @@ class PackageRepo(object):
         return diffs
 
     @contextlib.contextmanager
-    def committer(self, branch, msg, remote=None):
+    def committer(self, branch, msg, remote=None, checkout=True):
         """
         work with a Committer context to add files/changes to the index
 
         :param branch: branch name to work on
         :param msg: commit message
         :param remote: remote name to push changes to
+        :param checkout: check the branch out while the caller works. If False
+           the added files are taken from the current work tree and committed
+           onto the branch with plumbing, leaving the checkout alone
         :return:
         """
         comm = Committer(self.git, branch)
-        with self.on_branch(branch, remote=remote, push=True):
-            # yield committer to start context and add files
+        if checkout or branch == self.active_branch_name:
+            with self.on_branch(branch, remote=remote, push=True):
+                # yield committer to start context and add files
+                yield comm
+                # commit when done & push if remote provided
+                comm.commit(msg)
+                self._branch_moved(branch)
+        else:
             yield comm
-            # commit when done & push if remote provided
-            comm.commit(msg)
+            with self.ref_lock:
+                self.refs.update(f"{HEADS}{branch}", comm.commit_to_branch(msg))
+                if remote:
+                    self.push_refs(remote, [f"{HEADS}{branch}:{HEADS}{branch}"])
 
+    @traced()
+    @mutates_refs
     def initialize_branch(self, branch, remote):
         """
         branch initializer to ensure basics like 
@@ -435,20 +1104,18 @@ class PackageRepo(object):
         else:
             remote_br_exists = self.remote_branch_exists(remote, branch)
             
-        with self.on_branch(branch, remote) as br:
-            # checkout the branch, will create if not present
-            if not local_br_exists:
-                # new branch, ensure commit
-                self.git.git.commit(allow_empty=True, message=f"initialize branch {branch}")
-                self.git.create_head(branch, 'HEAD')
-
-            if remote_exists and (not remote_br_exists):
-                self.push(remote)
-
-            tracking_branch = br.tracking_branch()
-            if remote_exists and (not tracking_branch):
-                remote_ref = self.remote(remote).refs[branch]
-                br.set_tracking_branch(remote_ref)
+        if not local_br_exists:
+            # new branch from HEAD with an initial commit, no checkout needed
+            self.create_branch(branch, 'HEAD', message=f"initialize branch {branch}")
+
+        if remote_exists and (not remote_br_exists):
+            self.push_refs(remote, [f"{HEADS}{branch}:{HEADS}{branch}"])
+
+        br = self.heads[branch]
+        tracking_branch = br.tracking_branch()
+        if remote_exists and (not tracking_branch):
+            remote_ref = self.remote(remote).refs[branch]
+            br.set_tracking_branch(remote_ref)
 
 
 
@@ -1,15 +1,38 @@
 
+import os
+import time
+import signal
 import subprocess
+import collections
+
+from stratus import trace
+from stratus.lazy import lazy_import
+
+asyncio = lazy_import('asyncio')
 
 
 ENCODING='UTF-8'
 
+# seconds between SIGTERM and SIGKILL when a command times out
+KILL_GRACE = 2.0
+
+CommandResult = collections.namedtuple(
+    'CommandResult', 'command returncode stdout stderr duration timed_out'
+)
+
 
 def output_to_str(outp, split=True):
     """
     helper to convert shell output into strings/lists
+
+    :param split: True to split on any whitespace, 'lines' to split
+       on newlines only (keeps paths containing spaces intact),
+       False to return a single string
     """
-    outp = outp.decode('utf-8').strip()
+    outp = outp.decode('utf-8')
+    if split == 'lines':
+        return [x for x in outp.splitlines() if x.strip()]
+    outp = outp.strip()
     if split:
         outp = [x.strip() for x in outp.split() if x.strip()]
     return outp
@@ -21,8 +44,10 @@ def command_output(command, split=True):
     :param command: list of command line elements
     :return: stdout as string
     """
+    start = time.perf_counter()
     process = subprocess.Popen(command, stdout=subprocess.PIPE)
     outp, err = process.communicate()
+    trace.record_process(command, start, process.returncode, len(outp))
     if process.returncode:
         return None
     return output_to_str(outp, split=split)
@@ -35,6 +60,7 @@ def shell_command_output(command, split=True):
     :param command:  string containing shell command
     :return:
     """
+    start = time.perf_counter()
     process = subprocess.Popen(
         command,
         stdout=subprocess.PIPE,
@@ -43,6 +69,7 @@ def shell_command_output(command, split=True):
         shell=True
     )
     stdout, _ = process.communicate()
+    trace.record_process(command, start, process.returncode, len(stdout))
     stdout = output_to_str(stdout, split=split)
     if process.returncode != 0:
         raise RuntimeError(stdout)
@@ -50,3 +77,194 @@ def shell_command_output(command, split=True):
         if not split:
             return "\n".join(stdout.splitlines())
         return stdout
+
+
+def command_records(command, sep=b'\0', cwd=None, chunk_size=65536):
+    """
+    run command and yield its stdout split on sep as decoded strings,
+    as the child produces them rather than after it exits.
+    Only one chunk plus the current partial record is held in memory.
+    If the generator is closed early the child is killed.
+
+    :param command: list of command line elements
+    :param sep: record separator bytes
+    :param cwd: working dir for the command
+    :param chunk_size: max bytes to read from the pipe at once
+    :return: generator of strings
+    """
+    start = time.perf_counter()
+    output_bytes = 0
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd)
+    try:
+        # pieces of the current record, joined once it is complete
+        # so a record spanning many chunks isnt copied per chunk
+        parts = []
+        while True:
+            chunk = process.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            output_bytes += len(chunk)
+            offset = 0
+            end = chunk.find(sep)
+            while end != -1:
+                parts.append(chunk[offset:end])
+                yield b''.join(parts).decode(ENCODING, 'replace')
+                parts = []
+                offset = end + len(sep)
+                end = chunk.find(sep, offset)
+            if offset < len(chunk):
+                parts.append(chunk[offset:])
+        if parts:
+            yield b''.join(parts).decode(ENCODING, 'replace')
+        process.wait()
+        if process.returncode:
+            raise RuntimeError(f"command {command} failed with exit code {process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        trace.record_process(command, start, process.returncode, output_bytes)
+
+
+def command_lines(command, cwd=None, chunk_size=65536):
+    """
+    run command and yield its stdout line by line as the child
+    produces them, eg for git ls-files or pip freeze on big repos.
+    Lines are not otherwise stripped or split, so paths containing
+    spaces come through intact.
+
+    :param command: list of command line elements
+    :param cwd: working dir for the command
+    :return: generator of strings without line endings
+    """
+    for line in command_records(command, sep=b'\n', cwd=cwd, chunk_size=chunk_size):
+        yield line[:-1] if line.endswith('\r') else line
+
+
+def _signal_group(process, sig):
+    """send sig to the process group started for process"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, sig)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def _terminate(process, grace=KILL_GRACE):
+    """stop a timed out command and anything it spawned"""
+    _signal_group(process, getattr(signal, 'SIGTERM', None))
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        _signal_group(process, getattr(signal, 'SIGKILL', None))
+        await process.wait()
+
+
+async def run_command(command, timeout=None, cwd=None, stdin=None):
+    """
+    asyncio version of running a command, stdout and stderr are
+    captured separately.
+    The command runs in its own process group so that on timeout
+    it and any children it started are terminated together.
+
+    :param command: list of command line elements, or a string to run in shell mode
+    :param timeout: seconds before the command is terminated, None to wait forever
+    :param cwd: working dir for the command
+    :param stdin: optional bytes to send to the command
+    :return: CommandResult, stdout/stderr are bytes
+    """
+    start = time.perf_counter()
+    kwargs = dict(
+        cwd=cwd,
+        stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    if isinstance(command, str):
+        process = await asyncio.create_subprocess_shell(command, **kwargs)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, **kwargs)
+    timed_out = False
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(stdin), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        await _terminate(process)
+        stdout, stderr = b'', b''
+    except asyncio.CancelledError:
+        await _terminate(process)
+        raise
+    trace.record_process(command, start, process.returncode, len(stdout))
+    return CommandResult(
+        command, process.returncode, stdout, stderr,
+        time.perf_counter() - start, timed_out
+    )
+
+
+async def async_command_output(command, split=True, timeout=None, cwd=None):
+    """
+    asyncio version of command_output
+
+    :param command: list of command line elements
+    :param timeout: seconds before the command is terminated
+    :return: stdout as string or list, None if the command failed or timed out
+    """
+    result = await run_command(command, timeout=timeout, cwd=cwd)
+    if result.returncode or result.timed_out:
+        return None
+    return output_to_str(result.stdout, split=split)
+
+
+async def async_shell_command_output(command, split=True, timeout=None, cwd=None):
+    """
+    asyncio version of shell_command_output, raises RuntimeError with
+    the commands stderr if it fails or times out
+
+    :param command:  string containing shell command
+    :param timeout: seconds before the command is terminated
+    """
+    result = await run_command(command, timeout=timeout, cwd=cwd)
+    if result.timed_out:
+        raise RuntimeError(f"command timed out after {timeout}s: {command}")
+    if result.returncode != 0:
+        raise RuntimeError(
+            result.stderr.decode(ENCODING, 'replace').strip() or
+            result.stdout.decode(ENCODING, 'replace').strip()
+        )
+    stdout = output_to_str(result.stdout, split=split)
+    if not split:
+        return "\n".join(stdout.splitlines())
+    return stdout
+
+
+async def gather_commands(commands, concurrency=4, timeout=None, cwd=None):
+    """
+    run many independent commands with at most concurrency of them
+    running at once
+
+    :param commands: iterable of commands (lists or shell strings)
+    :param concurrency: max commands running at the same time
+    :param timeout: per command timeout in seconds
+    :param cwd: working dir for the commands
+    :return: list of CommandResult in the same order as commands
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(command):
+        async with semaphore:
+            return await run_command(command, timeout=timeout, cwd=cwd)
+
+    return await asyncio.gather(*(bounded(c) for c in commands))
+
+
+def run_commands(commands, concurrency=4, timeout=None, cwd=None):
+    """
+    blocking wrapper around gather_commands for non async callers
+
+    :return: list of CommandResult in the same order as commands
+    """
+    return asyncio.run(gather_commands(commands, concurrency=concurrency, timeout=timeout, cwd=cwd))
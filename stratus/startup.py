@@ -0,0 +1,155 @@
+"""
+startup profiling
+
+Support for the --profile-startup option of the stratus entry points.
+The command is re-run in a fresh interpreter with -X importtime so
+that every import made on the way to main() is measured, and a table
+of the slowest modules is printed instead of running the command: the
+entry points call startup_complete() once their imports and argument
+parsing are done, which exits the profiled process before it dispatches
+to the actual command.
+
+The wall clock time of the profiled process is checked against the
+startup budget (STRATUS_STARTUP_BUDGET seconds) and the exit code is
+non-zero if it is over.
+
+"""
+import os
+import sys
+import time
+import subprocess
+
+PROFILE_FLAG = '--profile-startup'
+# set in the profiled process so startup_complete() exits before dispatch
+PROFILE_ENV = 'STRATUS_PROFILING_STARTUP'
+BUDGET_ENV = 'STRATUS_STARTUP_BUDGET'
+DEFAULT_BUDGET = 0.5
+
+RUNNER = (
+    "import sys\n"
+    "sys.argv = sys.argv[1:]\n"
+    "module, _, func = {target!r}.partition(':')\n"
+    "sys.exit(getattr(__import__(module, fromlist=[func]), func)())\n"
+)
+
+
+def startup_budget():
+    """max seconds a command may take to start, from STRATUS_STARTUP_BUDGET"""
+    return float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET))
+
+
+def startup_complete():
+    """
+    called by the entry points after imports and argument parsing,
+    right before dispatching to the command. Exits if this process
+    is being profiled by --profile-startup
+    """
+    if os.environ.get(PROFILE_ENV):
+        sys.exit(0)
+
+
+def runner_command(target, argv, importtime=False):
+    """command to run an entry point (module:function) with argv in a fresh interpreter"""
+    command = [sys.executable]
+    if importtime:
+        command.extend(['-X', 'importtime'])
+    command.extend(['-c', RUNNER.format(target=target)])
+    command.extend(argv)
+    return command
+
+
+def time_startup(target, argv, iterations=1, env=None):
+    """
+    wall clock times of running an entry point in fresh interpreters
+
+    :param target: entry point, eg stratus.release.cli:main
+    :param argv: argv for the command, argv[0] is the program name
+    :param env: environment for the runs
+    :return: list of seconds per run
+    :raises RuntimeError: if the command fails
+    """
+    command = runner_command(target, argv)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        process = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timings.append(time.perf_counter() - start)
+        if process.returncode:
+            raise RuntimeError(
+                f"{argv} failed: {process.stderr.decode('utf-8', 'replace').strip()}"
+            )
+    return timings
+
+
+def parse_importtime(output):
+    """
+    parse -X importtime stderr output
+
+    :return: list of (module, self usec, cumulative usec, depth)
+    """
+    result = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative, name = line.split(':', 1)[1].split('|', 2)
+            self_us, cumulative = int(self_us), int(cumulative)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        result.append((name.strip(), self_us, cumulative, depth))
+    return result
+
+
+def profile_startup(target, argv, top=25, budget=None, stream=None):
+    """
+    run target (module:function) with argv under -X importtime up to
+    the point it would dispatch the command, and print the modules with
+    the highest cumulative import time
+
+    :param target: entry point, eg stratus.release.cli:main
+    :param argv: argv for the command, argv[0] is the program name
+    :param top: number of modules to report
+    :param budget: max startup seconds, defaults to startup_budget()
+    :return: exit code, the profiled process exit code if it failed,
+        1 if startup was over budget, otherwise 0
+    """
+    stream = stream or sys.stdout
+    budget = startup_budget() if budget is None else budget
+    env = dict(os.environ)
+    env[PROFILE_ENV] = '1'
+    start = time.perf_counter()
+    process = subprocess.run(
+        runner_command(target, argv, importtime=True),
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    elapsed = time.perf_counter() - start
+    stderr = process.stderr.decode('utf-8', 'replace')
+    timings = parse_importtime(stderr)
+    total = sum(t[1] for t in timings)
+    print(f"startup imports for {target}: {len(timings)} modules, {total / 1000:.1f}ms total", file=stream)
+    print(f"{'cumulative':>12}{'self':>10}  module", file=stream)
+    for name, self_us, cumulative, depth in sorted(timings, key=lambda t: t[2], reverse=True)[:top]:
+        print(f"{cumulative / 1000:>10.1f}ms{self_us / 1000:>8.1f}ms  {'  ' * depth}{name}", file=stream)
+    if process.returncode:
+        errors = [line for line in stderr.splitlines() if not line.startswith('import time:')]
+        print('\n'.join(errors), file=stream)
+        return process.returncode
+    over = elapsed > budget
+    print(
+        f"startup took {elapsed * 1000:.1f}ms (budget {budget * 1000:.0f}ms)"
+        f"{'  OVER BUDGET' if over else ''}",
+        file=stream
+    )
+    return 1 if over else 0
+
+
+def check_profile_startup(target):
+    """
+    if --profile-startup is in sys.argv, profile target with the
+    remaining args and exit instead of running the command
+    """
+    if PROFILE_FLAG not in sys.argv:
+        return
+    argv = [a for a in sys.argv if a != PROFILE_FLAG]
+    sys.exit(profile_startup(target, argv))
@@ -0,0 +1,172 @@
+"""
+semver tag index
+
+Persistent, sorted index of the semver tags in a repo used to answer
+"latest release", "latest in a major.minor line" and "latest
+prerelease" without parsing every tag on every run.
+
+The index stores the tag name: sha map it was built from. Each update
+diffs that against the current tags from the ref snapshot, so only
+tags that were added, moved or removed since the last run get parsed.
+
+"""
+import os
+import heapq
+import bisect
+import hashlib
+
+from stratus.cache import cache_dir, read_json, write_json
+from stratus.versions import Version
+
+
+class TagIndex(object):
+    """
+    Sorted index of semver tags
+
+    :param name: identifier for the persisted index, eg the repo git dir
+    :param prefix: tag prefix stripped before parsing, eg 'v'
+    :param index_file: path to persist the index to, defaults to the stratus cache
+    """
+    def __init__(self, name, prefix='', index_file=None):
+        self.prefix = prefix
+        if index_file is None:
+            digest = hashlib.sha1(f"{os.path.abspath(name)}:{prefix}".encode('utf-8')).hexdigest()
+            index_file = os.path.join(cache_dir('tags'), f"{digest}.json")
+        self.index_file = index_file
+        self._shas = {}
+        # parallel sorted lists of keys and (Version, tag) entries
+        self._release_keys = []
+        self._releases = []
+        self._pre_keys = []
+        self._prereleases = []
+        self._load()
+
+    def _load(self):
+        data = read_json(self.index_file, default={})
+        if data.get('prefix', self.prefix) != self.prefix:
+            return
+        self._shas = data.get('shas', {})
+        for field in ('releases', 'prereleases'):
+            # persisted in sorted order, no parsing or sorting needed
+            entries = [(Version(*e[1:]), e[0]) for e in data.get(field, [])]
+            keys = [v.key for v, _ in entries]
+            if field == 'releases':
+                self._releases, self._release_keys = entries, keys
+            else:
+                self._prereleases, self._pre_keys = entries, keys
+
+    def save(self):
+        def dump(entries):
+            return [[t, v.major, v.minor, v.patch, v.prerelease, v.build] for v, t in entries]
+        write_json(self.index_file, {
+            'prefix': self.prefix,
+            'shas': self._shas,
+            'releases': dump(self._releases),
+            'prereleases': dump(self._prereleases),
+        })
+
+    def _parse(self, tag):
+        if not tag.startswith(self.prefix):
+            return None
+        return Version.try_parse(tag[len(self.prefix):])
+
+    def _lists(self, version):
+        if version.prerelease is None:
+            return self._release_keys, self._releases
+        return self._pre_keys, self._prereleases
+
+    def _insert(self, tag, version):
+        keys, entries = self._lists(version)
+        i = bisect.bisect_right(keys, version.key)
+        keys.insert(i, version.key)
+        entries.insert(i, (version, tag))
+
+    def _remove(self, tag):
+        version = self._parse(tag)
+        if version is None:
+            return
+        keys, entries = self._lists(version)
+        i = bisect.bisect_left(keys, version.key)
+        while i < len(keys) and keys[i] == version.key:
+            if entries[i][1] == tag:
+                del keys[i]
+                del entries[i]
+                return
+            i += 1
+
+    def update(self, tags):
+        """
+        bring the index up to date with the current tags
+
+        :param tags: dict of tag name: sha, eg RefSnapshot.tags()
+        :return: number of tags that changed
+        """
+        changed = 0
+        for tag in [t for t in self._shas if t not in tags]:
+            self._remove(tag)
+            del self._shas[tag]
+            changed += 1
+        for tag, sha in tags.items():
+            known = self._shas.get(tag)
+            if known == sha:
+                continue
+            if known is not None:
+                self._remove(tag)
+            self._shas[tag] = sha
+            version = self._parse(tag)
+            if version is not None:
+                self._insert(tag, version)
+            changed += 1
+        if changed:
+            self.save()
+        return changed
+
+    def __len__(self):
+        return len(self._releases) + len(self._prereleases)
+
+    def versions(self, include_prerelease=False):
+        """all indexed (Version, tag) pairs in ascending order"""
+        if not include_prerelease:
+            return list(self._releases)
+        return list(heapq.merge(self._releases, self._prereleases, key=lambda e: e[0].key))
+
+    def latest(self):
+        """(Version, tag) of the highest release, None if there isnt one"""
+        return self._releases[-1] if self._releases else None
+
+    def _latest_below(self, keys, entries, bound, match):
+        i = bisect.bisect_left(keys, bound)
+        if i and match(entries[i - 1][0]):
+            return entries[i - 1]
+        return None
+
+    def latest_in_line(self, major, minor=None):
+        """
+        (Version, tag) of the highest release in a major or major.minor line
+
+        :param major: major version
+        :param minor: minor version, None for the whole major line
+        """
+        if minor is None:
+            return self._latest_below(
+                self._release_keys, self._releases, (major + 1,),
+                lambda v: v.major == major
+            )
+        return self._latest_below(
+            self._release_keys, self._releases, (major, minor + 1),
+            lambda v: v.major == major and v.minor == minor
+        )
+
+    def latest_prerelease(self, major=None, minor=None, patch=None):
+        """
+        (Version, tag) of the highest prerelease, optionally within a
+        major, major.minor or major.minor.patch line
+        """
+        if major is None:
+            return self._prereleases[-1] if self._prereleases else None
+        fields = tuple(f for f in (major, minor, patch) if f is not None)
+        bound = fields[:-1] + (fields[-1] + 1,)
+        return self._latest_below(
+            self._pre_keys, self._prereleases, bound,
+            lambda v: (v.major, v.minor, v.patch)[:len(fields)] == fields
+        )
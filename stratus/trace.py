@@ -0,0 +1,251 @@
+"""
+tracing
+
+Opt-in tracing of subprocesses, git operations and release action
+phases. Enable with the --trace <file> option of the release command
+or by setting STRATUS_TRACE=<file> in the environment (which is also
+inherited by delegated commands).
+
+When enabled, each span records its start time, duration and args (for
+processes: argv, exit code and bytes of output). At exit the events are
+written as Chrome trace-event JSON, viewable in chrome://tracing or
+Perfetto, and a per-phase summary table is printed to stderr.
+
+When tracing is disabled the helpers here are no-ops.
+
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+import collections
+
+TRACE_ENV = 'STRATUS_TRACE'
+TRACE_PARENT_ENV = 'STRATUS_TRACE_PARENT'
+
+PHASE = 'phase'
+PROCESS = 'process'
+
+
+class Tracer(object):
+    """
+    Collects trace events for one process
+
+    :param filename: file to write Chrome trace-event JSON to at exit
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = []
+        self.pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        # phases opened by any thread, so work handed to pool threads
+        # is still attributed to the phase that started it
+        self._open_phases = []
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _phases(self):
+        if not hasattr(self._local, 'phases'):
+            self._local.phases = []
+        return self._local.phases
+
+    def current_phase(self):
+        """innermost phase of this thread, falling back to the latest open phase"""
+        phases = self._phases() or self._open_phases
+        return phases[-1] if phases else None
+
+    @contextlib.contextmanager
+    def span(self, name, cat='stratus', **args):
+        """
+        time the enclosed block as a complete event, the yielded dict
+        can be used to add args once the work is done
+        """
+        phases = self._phases()
+        if cat == PHASE:
+            phases.append(name)
+            self._open_phases.append(name)
+        elif self.current_phase():
+            args.setdefault('phase', self.current_phase())
+        start = self._now_us()
+        try:
+            yield args
+        finally:
+            end = self._now_us()
+            if cat == PHASE:
+                phases.pop()
+                self._open_phases.remove(name)
+            self.events.append({
+                'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': start,
+                'dur': end - start,
+                'pid': self.pid,
+                'tid': threading.get_ident(),
+                'args': args,
+            })
+
+    def record_process(self, argv, start, duration, returncode, output_bytes):
+        """
+        record a process that already ran
+
+        :param argv: command line list
+        :param start: time.perf_counter() at start
+        :param duration: seconds
+        """
+        args = {
+            'argv': [str(a) for a in argv],
+            'returncode': returncode,
+            'output_bytes': output_bytes,
+        }
+        phase = self.current_phase()
+        if phase:
+            args['phase'] = phase
+        self.events.append({
+            'name': process_name(argv),
+            'cat': PROCESS,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def write(self):
+        """write the Chrome trace-event JSON file"""
+        with open(self.filename, 'w') as handle:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, handle)
+
+    def summary(self):
+        """per-phase summary table as a string"""
+        phases = collections.OrderedDict()
+        for e in self.events:
+            if e['cat'] == PHASE:
+                row = phases.setdefault(e['name'], collections.Counter())
+                row['calls'] += 1
+                row['wall'] += e['dur']
+        for e in self.events:
+            if e['cat'] != PROCESS:
+                continue
+            row = phases.setdefault(e['args'].get('phase', '(no phase)'), collections.Counter())
+            row['procs'] += 1
+            row['proc_time'] += e['dur']
+            row['bytes'] += e['args'].get('output_bytes') or 0
+        lines = [f"{'phase':<32}{'calls':>6}{'wall':>11}{'procs':>7}{'proc time':>11}{'output':>10}"]
+        for name, row in phases.items():
+            lines.append(
+                f"{name:<32}{row['calls']:>6}{row['wall'] / 1000:>9.1f}ms"
+                f"{row['procs']:>7}{row['proc_time'] / 1000:>9.1f}ms{row['bytes']:>9}B"
+            )
+        by_command = collections.Counter()
+        counts = collections.Counter()
+        for e in self.events:
+            if e['cat'] == PROCESS:
+                by_command[e['name']] += e['dur']
+                counts[e['name']] += 1
+        if by_command:
+            lines.append('')
+            lines.append(f"{'command':<32}{'count':>6}{'time':>11}")
+            for name, dur in by_command.most_common(10):
+                lines.append(f"{name:<32}{counts[name]:>6}{dur / 1000:>9.1f}ms")
+        return '\n'.join(lines)
+
+    def finish(self):
+        self.write()
+        print(f"trace written to {self.filename}", file=sys.stderr)
+        print(self.summary(), file=sys.stderr)
+
+
+def process_name(argv):
+    """short name for a command, eg 'git fetch'"""
+    if isinstance(argv, str):
+        return argv.split(' ', 1)[0]
+    argv = [str(a) for a in argv]
+    if not argv:
+        return '?'
+    name = os.path.basename(argv[0])
+    if name == 'git':
+        # skip global options, eg git -C dir cmd
+        args = iter(argv[1:])
+        for a in args:
+            if a in ('-C', '-c'):
+                next(args, None)
+            elif not a.startswith('-'):
+                return f"git {a}"
+    return name
+
+
+_TRACER = None
+_CHECKED = False
+
+
+def enable(filename):
+    """turn on tracing for this process, writing to filename at exit"""
+    global _TRACER, _CHECKED
+    _CHECKED = True
+    if _TRACER is None:
+        _TRACER = Tracer(os.path.abspath(filename))
+        # delegated commands inherit tracing, each writes its own file
+        os.environ.setdefault(TRACE_ENV, _TRACER.filename)
+        os.environ[TRACE_PARENT_ENV] = str(os.getpid())
+        atexit.register(_TRACER.finish)
+    return _TRACER
+
+
+def tracer():
+    """the active Tracer, or None if tracing is disabled"""
+    global _CHECKED
+    if not _CHECKED:
+        _CHECKED = True
+        filename = os.environ.get(TRACE_ENV)
+        if filename:
+            parent = os.environ.get(TRACE_PARENT_ENV)
+            if parent and parent != str(os.getpid()):
+                # child process of a traced command, dont clobber the parent's file
+                root, ext = os.path.splitext(filename)
+                filename = f"{root}.{os.getpid()}{ext or '.json'}"
+            enable(filename)
+    return _TRACER
+
+
+def span(name, cat='stratus', **args):
+    """tracer span context manager, or a no-op if tracing is disabled"""
+    t = tracer()
+    if t is None:
+        return contextlib.nullcontext(args)
+    return t.span(name, cat=cat, **args)
+
+
+def phase(name, **args):
+    """span marking a top level phase, eg a release action"""
+    return span(name, cat=PHASE, **args)
+
+
+def record_process(argv, start, returncode, output_bytes):
+    """record a finished process if tracing is enabled"""
+    t = tracer()
+    if t is not None:
+        t.record_process(argv, start, time.perf_counter() - start, returncode, output_bytes)
+
+
+def traced(name=None, cat='repo'):
+    """decorator that wraps a function call in a span"""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t = tracer()
+            if t is None:
+                return func(*args, **kwargs)
+            with t.span(label, cat=cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
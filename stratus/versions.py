@@ -1,5 +1,6 @@
 
-import semver
+import re
+import heapq
 import datetime
 
 
@@ -7,11 +8,215 @@ def today():
     return int(datetime.date.today().strftime('%Y%m%d'))
 
 
+SEMVER_RE = re.compile(
+    r"^(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)"
+    r"(?:-(?P<prerelease>[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+(?P<build>[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?$"
+)
+
+# last number in a string, for prerelease/build increments
+LAST_NUMBER_RE = re.compile(r"(?:0|[1-9][0-9]*)(?!.*[0-9])")
+
+
+def _increment_string(value):
+    """increment the last number in value, appending .0 if there is none"""
+    m = LAST_NUMBER_RE.search(value)
+    if m is None:
+        return f"{value}.0"
+    start, end = m.span()
+    return f"{value[:start]}{int(m.group()) + 1}{value[end:]}"
+
+
+def _prerelease_key(prerelease):
+    """
+    semver precedence key for prerelease identifiers: numeric identifiers
+    sort numerically and before alphanumeric ones, which sort lexically
+    """
+    return tuple(
+        (0, int(x), '') if x.isdigit() else (1, 0, x)
+        for x in prerelease.split('.')
+    )
+
+
+class Version(object):
+    """
+    Compact immutable semver version with a precomputed sort key.
+
+    The key orders versions by semver precedence, with the build metadata
+    as a final tie break so that the ordering is total.
+    """
+    __slots__ = ('major', 'minor', 'patch', 'prerelease', 'build', 'key')
+
+    def __init__(self, major=0, minor=0, patch=0, prerelease=None, build=None):
+        major, minor, patch = int(major), int(minor), int(patch)
+        prerelease = prerelease or None
+        build = build or None
+        setter = object.__setattr__
+        setter(self, 'major', major)
+        setter(self, 'minor', minor)
+        setter(self, 'patch', patch)
+        setter(self, 'prerelease', prerelease)
+        setter(self, 'build', build)
+        if prerelease is None:
+            key = (major, minor, patch, 1, (), build or '')
+        else:
+            key = (major, minor, patch, 0, _prerelease_key(prerelease), build or '')
+        setter(self, 'key', key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # rebuild through __init__, restoring slot state would go via __setattr__
+        return (type(self), (self.major, self.minor, self.patch, self.prerelease, self.build))
+
+    @classmethod
+    def parse(cls, value):
+        """
+        parse a semver string
+
+        :raises ValueError: if value is not valid semver
+        """
+        m = SEMVER_RE.match(value)
+        if m is None:
+            raise ValueError(f"{value} is not valid SemVer string")
+        return cls(*m.group('major', 'minor', 'patch', 'prerelease', 'build'))
+
+    @classmethod
+    def try_parse(cls, value):
+        """parse a semver string, returning None if it isnt valid"""
+        m = SEMVER_RE.match(value)
+        if m is None:
+            return None
+        return cls(*m.group('major', 'minor', 'patch', 'prerelease', 'build'))
 
+    def __str__(self):
+        v = f"{self.major}.{self.minor}.{self.patch}"
+        if self.prerelease:
+            v = f"{v}-{self.prerelease}"
+        if self.build:
+            v = f"{v}+{self.build}"
+        return v
 
+    def __repr__(self):
+        return f"Version('{self}')"
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key < other.key
+
+    def __le__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key <= other.key
+
+    def __gt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key > other.key
+
+    def __ge__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key >= other.key
+
+    def to_dict(self):
+        return {
+            'major': self.major,
+            'minor': self.minor,
+            'patch': self.patch,
+            'prerelease': self.prerelease,
+            'build': self.build,
+        }
+
+    @property
+    def is_prerelease(self):
+        return self.prerelease is not None
+
+    def bump_major(self):
+        return Version(self.major + 1, 0, 0)
+
+    def bump_minor(self):
+        return Version(self.major, self.minor + 1, 0)
+
+    def bump_patch(self):
+        return Version(self.major, self.minor, self.patch + 1)
+
+    def bump_prerelease(self, token='rc'):
+        pre = _increment_string(self.prerelease or f"{token}.0")
+        return Version(self.major, self.minor, self.patch, pre)
+
+    def bump_build(self, token='build'):
+        build = _increment_string(self.build or f"{token}.0")
+        return Version(self.major, self.minor, self.patch, self.prerelease, build)
+
+    def finalize(self):
+        return Version(self.major, self.minor, self.patch)
+
+    def replace(self, **fields):
+        values = self.to_dict()
+        values.update(fields)
+        return Version(**values)
+
+
+def parse_versions(values, strict=False):
+    """
+    bulk parse version strings
+
+    :param values: iterable of strings
+    :param strict: raise ValueError on invalid strings instead of skipping them
+    :return: list of Version
+    """
+    if strict:
+        return [Version.parse(v) for v in values]
+    result = []
+    match = SEMVER_RE.match
+    for v in values:
+        m = match(v)
+        if m is not None:
+            result.append(Version(*m.group('major', 'minor', 'patch', 'prerelease', 'build')))
+    return result
+
+
+def sort_versions(versions, reverse=False):
+    """sort Versions by precedence using the precomputed keys"""
+    return sorted(versions, key=_version_key, reverse=reverse)
 
-class PackageVersion(dict):
 
+def max_version(versions, include_prerelease=True):
+    """
+    highest Version in versions, None if empty
+
+    :param include_prerelease: if False, ignore prerelease versions
+    """
+    if not include_prerelease:
+        versions = (v for v in versions if v.prerelease is None)
+    return max(versions, key=_version_key, default=None)
+
+
+def largest_versions(versions, n):
+    """the n highest Versions, highest first"""
+    return heapq.nlargest(n, versions, key=_version_key)
+
+
+def _version_key(v):
+    return v.key
+
+
+class PackageVersion(dict):
+    """
+    Mutable dict style version API, backed by Version for parsing,
+    formatting, comparisons and bumps
+    """
 
     def __init__(self, v=None, major=None, minor=None, micro=None, build=None, prerelease=None):
         super(PackageVersion, self).__init__()
@@ -26,26 +231,32 @@ class PackageVersion(dict):
             self.parse_version(v)
 
     def parse_version(self, v):
-        self.update(semver.parse(v))
+        self._set(Version.parse(v))
 
-    def __str__(self):
-        pre = None
-        build = None
-        if self['prerelease']:
-            pre = f"{self.pre_token}.{self['prerelease']}"
-        if self['build']:
-            build = f"{self.build_token}.{self['build']}"
-        v = semver.format_version(
-            self.major,
-            self.minor,
-            self.patch,
-            prerelease=self['prerelease'],
-            build=self['build']
+    def _set(self, version):
+        self.update(version.to_dict())
+        return str(version)
+
+    @property
+    def version(self):
+        """Version instance for the current field values"""
+        return Version(
+            self['major'] or 0,
+            self['minor'] or 0,
+            self['patch'] or 0,
+            self['prerelease'],
+            self['build']
         )
-        return v
+
+    @property
+    def sort_key(self):
+        return self.version.key
+
+    def __str__(self):
+        return str(self.version)
 
     def _version_info(self):
-        return semver.parse_version_info(str(self))
+        return self.version
 
     @property
     def major(self):
@@ -97,37 +308,27 @@ class PackageVersion(dict):
         self['build'] = x
 
     def bump_major(self):
-        v = semver.bump_major(str(self))
-        self.parse_version(v)
-        return v
+        return self._set(self.version.bump_major())
 
     def bump_minor(self):
-        v = semver.bump_minor(str(self))
-        self.parse_version(v)
-        return v
+        return self._set(self.version.bump_minor())
 
     def bump_micro(self):
         return self.bump_patch()
 
     def bump_patch(self):
-        v = semver.bump_patch(str(self))
-        self.parse_version(v)
-        return v
+        return self._set(self.version.bump_patch())
 
     def bump_pre(self, token=None):
-        v = semver.bump_prerelease(str(self), token=self.pre_token)
-        self.parse_version(v)
-        return v
+        return self._set(self.version.bump_prerelease(token=token or self.pre_token))
 
     def bump_build(self, token=None):
         if token:
             self.build_token = token
-        v = semver.bump_build(str(self), token=self.build_token)
-        self.parse_version(v)
-        return v
+        return self._set(self.version.bump_build(token=self.build_token))
 
     def finalize(self):
-        return semver.finalize_version(str(self))
+        return str(self.version.finalize())
 
     def new_dev_release(self):
         v = self.bump_build(token='dev')
@@ -0,0 +1,62 @@
+"""
+Configuration change tracking tests
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from stratus.configuration import Configuration
+
+SETUP_CFG = """[metadata]
+name = example
+version = 1.0.0
+
+[options]
+packages = find:
+install_requires =
+    requests
+    six
+"""
+
+
+class DirtySectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='stratus-test-')
+        self.env = mock.patch.dict(os.environ, {'STRATUS_CACHE_DIR': os.path.join(self.dir, 'cache')})
+        self.env.start()
+        self.filename = os.path.join(self.dir, 'setup.cfg')
+        with open(self.filename, 'w') as handle:
+            handle.write(SETUP_CFG)
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def load(self, cache=True):
+        config = Configuration()
+        config.load(self.filename, cache=cache)
+        return config
+
+    def test_read_only_access_is_clean(self):
+        for cache in (False, True, True):
+            config = self.load(cache=cache)
+            self.assertEqual(config['metadata']['name'], 'example')
+            self.assertIn('requests', config['options']['install_requires'])
+            list(config.items())
+            self.assertEqual(config.dirty_sections(), {})
+            self.assertFalse(config.save())
+
+    def test_changed_section_is_dirty(self):
+        config = self.load()
+        config['metadata']['version'] = '1.0.1'
+        self.assertEqual(list(config.dirty_sections()), ['metadata'])
+        self.assertTrue(config.save())
+        self.assertEqual(self.load(cache=False)['metadata']['version'], '1.0.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
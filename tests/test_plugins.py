@@ -0,0 +1,63 @@
+"""
+plugin registry index invalidation tests
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from stratus.plugins import PluginRegistry
+
+GROUP = 'stratus_test_plugins'
+
+
+class PluginRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='stratus-test-')
+        self.site = os.path.join(self.dir, 'site')
+        dist_info = os.path.join(self.site, 'example.dist-info')
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as handle:
+            handle.write('Metadata-Version: 2.1\nName: example\nVersion: 1.0\n')
+        self.entry_points = os.path.join(dist_info, 'entry_points.txt')
+        self.write_entry_points(['first = os.path:join'])
+        self.index_file = os.path.join(self.dir, 'plugins.json')
+        sys.path.append(self.site)
+
+    def tearDown(self):
+        sys.path.remove(self.site)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write_entry_points(self, lines):
+        with open(self.entry_points, 'w') as handle:
+            handle.write('[{}]\n{}\n'.format(GROUP, '\n'.join(lines)))
+
+    def touch_later(self):
+        # make sure the mtime moves on filesystems with coarse timestamps
+        st = os.stat(self.entry_points)
+        os.utime(self.entry_points, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def test_entry_points_edited_in_place(self):
+        self.assertEqual(PluginRegistry(self.index_file).names(GROUP), ['first'])
+        self.write_entry_points(['first = os.path:join', 'second = os.path:split'])
+        self.touch_later()
+        self.assertEqual(PluginRegistry(self.index_file).names(GROUP), ['first', 'second'])
+
+    def test_lookup_miss_rescans(self):
+        registry = PluginRegistry(self.index_file)
+        plugins = registry.plugins(GROUP)
+        self.assertIs(plugins['first'], os.path.join)
+        # an edit the fingerprint cant see, eg within the same mtime tick
+        st = os.stat(self.entry_points)
+        self.write_entry_points(['first = os.path:join', 'second = os.path:split'])
+        os.utime(self.entry_points, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertIs(plugins['second'], os.path.split)
+        with self.assertRaises(KeyError):
+            plugins['missing']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+release publishing tests against the local upload server stand-in
+in benchmarks/publish_server.py
+
+"""
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from stratus.release.publish import Publisher, UPLOADED, SKIPPED, FAILED
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from publish_server import serve  # noqa: E402
+
+METADATA = 'Metadata-Version: 2.1\nName: example\nVersion: {version}\n\n{description}\n'
+
+
+class PublishTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='stratus-test-')
+        self.dist_dir = os.path.join(self.dir, 'dist')
+        os.makedirs(self.dist_dir)
+        self.index_dir = os.path.join(self.dir, 'index')
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def start(self, **options):
+        self.server = serve(self.index_dir, **options)
+        publisher = Publisher(f"http://127.0.0.1:{self.server.server_port}/", backoff=0.01)
+        self.addCleanup(publisher.close)
+        return publisher
+
+    def wheel(self, version='1.0', description='first', dirname=None):
+        """write a minimal wheel, description varies its content"""
+        filename = os.path.join(dirname or self.dist_dir, f"example-{version}-py3-none-any.whl")
+        with zipfile.ZipFile(filename, 'w') as archive:
+            archive.writestr(
+                f"example-{version}.dist-info/METADATA",
+                METADATA.format(version=version, description=description)
+            )
+        return filename
+
+    def index_file(self, filename):
+        return os.path.join(self.index_dir, 'example', os.path.basename(filename))
+
+    def test_upload(self):
+        publisher = self.start()
+        files = [self.wheel('1.0'), self.wheel('1.1')]
+        report = publisher.publish(files)
+        self.assertTrue(report.ok)
+        self.assertEqual({r.status for r in report.values()}, {UPLOADED})
+        for filename in files:
+            self.assertTrue(os.path.exists(self.index_file(filename)))
+        self.assertEqual(self.server.uploads, 2)
+
+    def test_skip_existing_by_sha256(self):
+        filename = self.wheel()
+        report = self.start().publish([filename])
+        self.assertEqual(report[os.path.basename(filename)].status, UPLOADED)
+        # a fresh publisher, as when re-running an interrupted publish
+        publisher = Publisher(f"http://127.0.0.1:{self.server.server_port}/")
+        self.addCleanup(publisher.close)
+        result = publisher.upload(filename)
+        self.assertEqual(result.status, SKIPPED)
+        self.assertEqual(result.attempts, 0)
+        self.assertEqual(self.server.uploads, 1)
+
+    def test_different_file_with_same_name(self):
+        other = os.path.join(self.dir, 'other')
+        os.makedirs(other)
+        self.start().upload(self.wheel(description='other', dirname=other))
+        publisher = Publisher(f"http://127.0.0.1:{self.server.server_port}/")
+        self.addCleanup(publisher.close)
+        result = publisher.upload(self.wheel())
+        self.assertEqual(result.status, FAILED)
+        self.assertIn('different file', result.error)
+
+    def uploaded_elsewhere(self, filename, content_of):
+        """put content_of on the index as filename, bypassing the upload API"""
+        os.makedirs(os.path.join(self.index_dir, 'example'), exist_ok=True)
+        shutil.copy(content_of, self.index_file(filename))
+
+    def test_conflict_after_hash_check(self):
+        publisher = self.start()
+        self.assertEqual(publisher.existing_hashes('example'), {})
+        filename = self.wheel()
+        self.uploaded_elsewhere(filename, self.wheel(description='other', dirname=self.dir))
+        result = publisher.upload(filename)
+        self.assertEqual(result.status, FAILED)
+        self.assertIn('409', result.error)
+
+    def test_same_file_uploaded_after_hash_check(self):
+        publisher = self.start()
+        self.assertEqual(publisher.existing_hashes('example'), {})
+        filename = self.wheel()
+        self.uploaded_elsewhere(filename, filename)
+        self.assertEqual(publisher.upload(filename).status, SKIPPED)
+
+    def test_retries_on_5xx(self):
+        publisher = self.start(fail_first=2)
+        result = publisher.upload(self.wheel())
+        self.assertEqual(result.status, UPLOADED)
+        self.assertEqual(result.attempts, 3)
+        self.assertEqual(self.server.failures, 2)
+
+    def test_gives_up_after_retries(self):
+        publisher = self.start(fail_first=10)
+        publisher.retries = 2
+        result = publisher.upload(self.wheel())
+        self.assertEqual(result.status, FAILED)
+        self.assertEqual(result.attempts, 3)
+        self.assertIn('503', result.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+PackageRepo checkout-free branch operation tests, run against
+throwaway repos with a local bare remote
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+from stratus.repository import PackageRepo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'test',
+    'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'test',
+    'GIT_COMMITTER_EMAIL': 'test@example.com',
+}
+
+
+def git(*args, cwd=None):
+    process = subprocess.run(
+        ['git'] + list(args), cwd=cwd, check=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return process.stdout.decode('utf-8').strip()
+
+
+class RepositoryBranchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, GIT_ENV)
+        self.env.start()
+        self.dir = tempfile.mkdtemp(prefix='stratus-test-')
+        self.upstream = os.path.join(self.dir, 'upstream')
+        git('init', '-q', '-b', 'master', self.upstream)
+        git('commit', '-q', '--allow-empty', '-m', 'initial', cwd=self.upstream)
+        git('branch', 'develop', cwd=self.upstream)
+        git('checkout', '-q', '-b', 'feature', cwd=self.upstream)
+        git('commit', '-q', '--allow-empty', '-m', 'feature', cwd=self.upstream)
+        git('checkout', '-q', 'master', cwd=self.upstream)
+        self.work = os.path.join(self.dir, 'work')
+        git('clone', '-q', self.upstream, self.work)
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_fast_forward_missing_local_branch(self):
+        repo = PackageRepo(self.work)
+        self.assertNotIn('develop', repo.branches)
+        self.assertTrue(repo.fast_forward('develop', 'refs/remotes/origin/develop'))
+        self.assertEqual(
+            repo.commit_sha('develop'), git('rev-parse', 'origin/develop', cwd=self.work)
+        )
+        self.assertFalse(repo.fast_forward('missing', 'refs/remotes/origin/missing'))
+
+    def test_merge_into_remote_only_branch(self):
+        repo = PackageRepo(self.work)
+        repo.merge('origin/feature', 'develop', remote='origin')
+        self.assertEqual(
+            repo.commit_sha('develop'), git('rev-parse', 'origin/feature', cwd=self.work)
+        )
+        self.assertEqual(repo.active_branch_name, 'master')
+
+    def test_initialize_branch_unborn_head(self):
+        # git mktree must not wait on the callers stdin, which is left open here
+        fresh = os.path.join(self.dir, 'fresh')
+        git('init', '-q', '-b', 'master', fresh)
+        git('remote', 'add', 'origin', self.upstream, cwd=fresh)
+        script = (
+            "import sys\n"
+            "from stratus.repository import PackageRepo\n"
+            "PackageRepo(sys.argv[1]).initialize_branch('init', 'origin')\n"
+        )
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+        log = os.path.join(self.dir, 'init.log')
+        with open(log, 'wb') as output:
+            process = subprocess.Popen(
+                [sys.executable, '-c', script, fresh], env=env,
+                stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT
+            )
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                self.fail('initialize_branch blocked reading stdin')
+            finally:
+                process.stdin.close()
+        with open(log) as handle:
+            err = handle.read()
+        self.assertEqual(process.returncode, 0, err)
+        self.assertEqual(git('log', '--format=%s', 'init', cwd=fresh), 'initialize branch init')
+
+
+def process_alive(pid):
+    """True if pid is running, zombies count as dead"""
+    try:
+        with open(f'/proc/{pid}/stat') as handle:
+            return handle.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+class FetchRemotesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, GIT_ENV)
+        self.env.start()
+        self.dir = tempfile.mkdtemp(prefix='stratus-test-')
+        self.work = os.path.join(self.dir, 'work')
+        git('init', '-q', '-b', 'master', self.work)
+        git('commit', '-q', '--allow-empty', '-m', 'initial', cwd=self.work)
+        for name in ('alpha', 'beta', 'gamma'):
+            bare = os.path.join(self.dir, f'{name}.git')
+            git('init', '-q', '--bare', bare)
+            git('push', '-q', bare, f'master:refs/heads/{name}', cwd=self.work)
+            git('remote', 'add', name, bare, cwd=self.work)
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_fetch_several_remotes(self):
+        repo = PackageRepo(self.work)
+        report = repo.fetch_remotes(concurrency=2, timeout=60)
+        self.assertEqual(sorted(report), ['alpha', 'beta', 'gamma'])
+        self.assertTrue(report.ok)
+        self.assertEqual(report.failed, [])
+        for name in ('alpha', 'beta', 'gamma'):
+            self.assertTrue(repo.remote_branch_exists(name, name))
+        self.assertEqual(len(report.summary().splitlines()), 3)
+
+    def test_unreachable_remote(self):
+        git('remote', 'set-url', 'beta', os.path.join(self.dir, 'missing.git'), cwd=self.work)
+        repo = PackageRepo(self.work)
+        report = repo.fetch_remotes(timeout=60)
+        self.assertFalse(report.ok)
+        self.assertEqual([r.remote for r in report.failed], ['beta'])
+        self.assertFalse(report['beta'].timed_out)
+        self.assertTrue(report['beta'].error)
+        self.assertTrue(report['alpha'].ok and report['gamma'].ok)
+        self.assertTrue(repo.remote_branch_exists('alpha', 'alpha'))
+        self.assertIn('failed', report.summary())
+        with self.assertRaises(RuntimeError):
+            repo.fetch()
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'needs /proc and process groups')
+    def test_remote_timeout_kills_process_group(self):
+        # upload-pack stand in that hangs with a child process of its own
+        pid_file = os.path.join(self.dir, 'child.pid')
+        script = os.path.join(self.dir, 'slow-upload-pack')
+        with open(script, 'w') as handle:
+            handle.write(f'#!/bin/sh\nsleep 60 &\necho $! > {pid_file}\nwait\n')
+        os.chmod(script, 0o755)
+        git('config', 'remote.gamma.uploadpack', script, cwd=self.work)
+        repo = PackageRepo(self.work)
+        start = time.monotonic()
+        report = repo.fetch_remotes(timeout=2)
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertTrue(report['gamma'].timed_out)
+        self.assertIn('timed out', report['gamma'].error)
+        self.assertEqual([r.remote for r in report.failed], ['gamma'])
+        self.assertTrue(report['alpha'].ok and report['beta'].ok)
+        with open(pid_file) as handle:
+            child = int(handle.read())
+        deadline = time.monotonic() + 5
+        while process_alive(child) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(process_alive(child), 'upload-pack child survived the timeout')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+startup time budget tests
+
+Each entry point is started in fresh interpreters and the median wall
+clock time must be within the startup budget (STRATUS_STARTUP_BUDGET
+seconds, 0.5 by default).
+
+"""
+import os
+import unittest
+import statistics
+
+from stratus.startup import startup_budget, time_startup, profile_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ITERATIONS = 5
+
+
+class StartupBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = dict(os.environ)
+        self.env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, self.env.get('PYTHONPATH')]))
+        self.env.pop('STRATUS_TRACE', None)
+        self.budget = startup_budget()
+
+    def assert_within_budget(self, target, argv):
+        # first run warms up the plugin and binary indexes
+        time_startup(target, argv, 1, env=self.env)
+        median = statistics.median(time_startup(target, argv, ITERATIONS, env=self.env))
+        self.assertLessEqual(
+            median, self.budget,
+            f"{' '.join(argv)} took {median * 1000:.0f}ms to start, budget is {self.budget * 1000:.0f}ms"
+        )
+
+    def test_launcher_help(self):
+        self.assert_within_budget('stratus.launcher:main', ['stratus', '--help'])
+
+    def test_release_help(self):
+        self.assert_within_budget('stratus.release.cli:main', ['stratus-release', '-h'])
+
+    def test_profile_over_budget(self):
+        with open(os.devnull, 'w') as devnull:
+            result = profile_startup('stratus.launcher:main', ['stratus', '--help'], budget=0, stream=devnull)
+        self.assertEqual(result, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()